@@ -1,7 +1,7 @@
 import streamlit as st
 import os
 import shutil
-import zipfile
+import uuid
 import pandas as pd
 from PIL import Image
 from src.parse_excel import load_excel, extract_profile_data
@@ -9,13 +9,262 @@ from src.downloader import download_photos
 from src.validator import validate_photos_in_folder, save_validation_results
 from src.cropper import crop_photos_in_folder
 from src.size_adjuster import resize_photos_in_folder
+from src.pipeline import process_photos_in_folder
+from src.cache import ProcessingCache
+from src.metrics import RunMetrics
+from src.zip_export import zip_bytes, run_output_files
+from src.jobs import JobManager, JobQueueFull, ACTIVE_STATUSES
 
 st.set_page_config(page_title="Profile Photo Processor", page_icon="🖼️")
 st.title("🖼️ Profile Photo Processing Tool")
 
-# Set up directories
-OUTPUT_DIR = "streamlit_output"
-UPLOAD_DIR = "streamlit_uploaded"
+CACHE_DIR = "streamlit_cache"
+JOB_WORKERS = 2  # batches processed at the same time, the others wait in the queue
+JOB_QUEUE_SIZE = 8  # maximum number of queued and running batches
+WORKSPACE_TTL_SECONDS = 3600  # workspaces of sessions inactive for this long are deleted
+
+# Shared by all reruns and sessions, so photos that were processed before are not processed again
+cache = st.cache_resource(lambda: ProcessingCache(CACHE_DIR))()
+# Shared by all sessions: batches run in the background, each session in its own temporary workspace
+jobs = st.cache_resource(
+    lambda: JobManager(max_workers=JOB_WORKERS, max_pending=JOB_QUEUE_SIZE, ttl_seconds=WORKSPACE_TTL_SECONDS)
+)()
+
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+session_id = st.session_state.session_id
+jobs.workspace(session_id)  # keeps this session's workspace alive
+jobs.cleanup()
+
+def require_photos(folder, step, earlier_step):
+    """
+    Make sure the input folder of a step holds the photos of an earlier step of this session,
+    raising an error that tells which step to select otherwise.
+    """
+    if not os.path.isdir(folder) or not any(os.path.isfile(os.path.join(folder, name)) for name in os.listdir(folder)):
+        raise ValueError(f"{step} needs the photos of the {earlier_step} step, but none were made in this session "
+                         f"yet. Select {earlier_step} too.")
+
+def reset_step_folder(folder):
+    """
+    Empty the output folder of a step (and its 'failed' subfolder) before the step runs, so it only holds
+    the outputs of this run. The folders of the steps that are not selected are kept for later steps.
+    """
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder)
+
+def run_excel_job(job, df, steps, crop_mode):
+    """
+    Background job of the Excel tab: run the selected steps on the photos of the report.
+    The photos of each step are kept in the session workspace, so a later run can start from the
+    outputs of an earlier one (e.g. Validate after Crop and Resize); the report goes in the job folder.
+    Returns the results shown by show_job_result.
+    """
+    metrics = RunMetrics()
+    result = {'messages': [], 'errors': [], 'validation': None}
+    profiles = extract_profile_data(
+        df,
+        id_col="Confirmation_Number",
+        url_col="Image_URL",
+        photoname_col="Photo_Name"
+    )
+
+    stage_root = os.path.join(jobs.workspace(job.session_id), "report")
+    downloaded_dir = os.path.join(stage_root, "downloaded")
+    cropped_dir = os.path.join(stage_root, "cropped")
+    resized_dir = os.path.join(stage_root, "resized")
+    output_dirs = []  # folders written by this run, exported in the ZIP
+
+    if "Download" in steps:
+        reset_step_folder(downloaded_dir)
+        output_dirs.append(downloaded_dir)
+        errors = download_photos(profiles, output_folder=downloaded_dir, metrics=metrics,
+                                 progress=job.progress("⬇️ Downloading photos"))
+        if errors:
+            result['messages'].append(("warning", f"{len(errors)} photos failed to download."))
+        else:
+            result['messages'].append(("success", "All photos downloaded!"))
+
+    if "Crop" in steps and "Resize" in steps:
+        require_photos(downloaded_dir, "Crop", "Download")
+        reset_step_folder(resized_dir)
+        output_dirs.append(resized_dir)
+        # Crop, resize and validate each photo in one decode instead of folder-to-folder passes
+        validation, errors = process_photos_in_folder(downloaded_dir, resized_dir, cache=cache, metrics=metrics,
+                                                      progress=job.progress("✂️ Cropping and resizing photos"),
+                                                      crop_mode=crop_mode)
+        result['errors'] += errors
+        result['messages'].append(("success", "Cropping and resizing completed!"))
+    else:
+        validation = None
+        if "Crop" in steps:
+            require_photos(downloaded_dir, "Crop", "Download")
+            reset_step_folder(cropped_dir)
+            output_dirs.append(cropped_dir)
+            result['errors'] += crop_photos_in_folder(downloaded_dir, cropped_dir, cache=cache, metrics=metrics,
+                                                      progress=job.progress("✂️ Cropping photos"), mode=crop_mode)
+            result['messages'].append(("success", "Cropping completed!"))
+
+        if "Resize" in steps:
+            require_photos(cropped_dir, "Resize", "Crop")
+            reset_step_folder(resized_dir)
+            output_dirs.append(resized_dir)
+            result['errors'] += resize_photos_in_folder(cropped_dir, resized_dir, cache=cache, metrics=metrics,
+                                                        progress=job.progress("📏 Resizing photos"))
+            result['messages'].append(("success", "Resizing completed!"))
+
+    # Only this run's photos go into the ZIP
+    result['zip_files'] = run_output_files(
+        stage_root,
+        output_dirs,
+        [f"{profile['photoname']}.jpg" for profile in profiles],
+    )
+    if "Validate" in steps:
+        if validation is None:
+            require_photos(resized_dir, "Validate", "Resize")
+            validation = validate_photos_in_folder(resized_dir, metrics=metrics)
+        output_report = os.path.join(job.folder, "photo_validation_results.xlsx")
+        save_validation_results(validation, output_report, merge_original_df=df, left_on="Photo_Name", right_on="Photo_Name")
+        result['validation'] = validation
+        result['messages'].append(("success", "Validation report saved!"))
+        result['zip_files'].append((output_report, os.path.basename(output_report)))
+
+    result['metrics'] = metrics.summary()
+    return result
+
+def run_upload_job(job, uploads, process_steps, crop_mode):
+    """
+    Background job of the upload tab: save the uploaded images in the session workspace and run the selected
+    steps there, like run_excel_job; the report goes in the job folder.
+    :param uploads: List of (file name, file bytes) tuples
+    :param crop_mode: "center" or "face"
+    Returns the results shown by show_job_result.
+    """
+    metrics = RunMetrics()
+    result = {'messages': [], 'errors': [], 'validation': None}
+
+    stage_root = os.path.join(jobs.workspace(job.session_id), "upload")
+    input_folder = os.path.join(stage_root, "uploaded")
+    cropped_folder = os.path.join(stage_root, "cropped")
+    resized_folder = os.path.join(stage_root, "resized")
+    output_folders = []  # folders written by this run, exported in the ZIP
+    reset_step_folder(input_folder)
+    for name, data in uploads:
+        with open(os.path.join(input_folder, os.path.basename(name)), "wb") as f:
+            f.write(data)
+
+    validation = None
+    if "Crop" in process_steps and "Resize" in process_steps:
+        reset_step_folder(resized_folder)
+        output_folders.append(resized_folder)
+        # Crop, resize and validate each photo in one decode instead of folder-to-folder passes
+        validation, errors = process_photos_in_folder(input_folder, resized_folder, cache=cache, metrics=metrics,
+                                                      progress=job.progress("✂️ Cropping and resizing photos"),
+                                                      crop_mode=crop_mode)
+        result['errors'] += errors
+        result['messages'].append(("success", "Cropping and resizing completed!"))
+    else:
+        if "Crop" in process_steps:
+            reset_step_folder(cropped_folder)
+            output_folders.append(cropped_folder)
+            result['errors'] += crop_photos_in_folder(input_folder, cropped_folder, cache=cache, metrics=metrics,
+                                                      progress=job.progress("✂️ Cropping photos"), mode=crop_mode)
+            result['messages'].append(("success", "Cropping completed!"))
+            input_folder = cropped_folder  # use cropped output for next step
+
+        if "Resize" in process_steps:
+            reset_step_folder(resized_folder)
+            output_folders.append(resized_folder)
+            result['errors'] += resize_photos_in_folder(input_folder, resized_folder, cache=cache, metrics=metrics,
+                                                        progress=job.progress("📏 Resizing photos"))
+            result['messages'].append(("success", "Resizing completed!"))
+
+    # Only this run's photos go into the ZIP
+    result['zip_files'] = run_output_files(
+        stage_root,
+        output_folders,
+        [os.path.basename(name) for name, _ in uploads],
+    )
+    if "Validate" in process_steps:
+        if validation is None:
+            require_photos(resized_folder, "Validate", "Resize")
+            validation = validate_photos_in_folder(resized_folder, metrics=metrics)
+        output_report = os.path.join(job.folder, "validation_results.xlsx")
+        save_validation_results(validation, output_report)
+        result['validation'] = validation
+        result['messages'].append(("success", "Validation report saved!"))
+        result['zip_files'].append((output_report, os.path.basename(output_report)))
+
+    result['metrics'] = metrics.summary()
+    return result
+
+def submit_job(state_key, func, *args):
+    """
+    Submit a background job and remember its id in the session state under state_key.
+    """
+    try:
+        st.session_state[state_key] = jobs.submit(session_id, func, *args)
+    except JobQueueFull as e:
+        st.error(f"❌ The server is busy: {e}.")
+
+@st.fragment(run_every=1)
+def poll_job(job_id):
+    """
+    Show the progress of a running job, refreshed every second. Reruns the page once the job has finished.
+    """
+    job = jobs.get(job_id)
+    if job is None or job['status'] not in ACTIVE_STATUSES:
+        st.rerun()
+    if job['status'] == 'queued':
+        st.info("⏳ Waiting for a free worker...")
+        return
+    done, total = job['done'], job['total']
+    text = f"{job['stage'] or '🚀 Starting'}: {done}/{total or '?'} photos"
+    if job['eta_seconds'] is not None:
+        text += f", about {job['eta_seconds']:.0f}s left"
+    st.progress(done / total if total else 0.0, text=text)
+
+def show_job(state_key, zip_label):
+    """
+    Show the job remembered under state_key: its progress while it runs, its results once it is done.
+    """
+    job_id = st.session_state.get(state_key)
+    if not job_id:
+        return
+    job = jobs.get(job_id)
+    if job is None:
+        st.warning("These results have expired, please run the steps again.")
+    elif job['status'] in ACTIVE_STATUSES:
+        poll_job(job_id)
+    elif job['status'] == 'failed':
+        st.error(f"❌ Processing failed: {job['error']}")
+    else:
+        show_job_result(job['result'], zip_label)
+
+def show_job_result(result, zip_label):
+    """
+    Show the messages, errors, validation results and metrics of a finished job, and the ZIP download.
+    """
+    for level, message in result['messages']:
+        getattr(st, level)(message)
+    if result['errors']:
+        st.warning(f"{len(result['errors'])} photos could not be processed.")
+        st.dataframe(pd.DataFrame(result['errors']))
+    if result['validation'] is not None:
+        st.dataframe(pd.DataFrame(result['validation']))
+    if result['metrics']:
+        with st.expander("⏱️ Run metrics"):
+            st.dataframe(pd.DataFrame(result['metrics']))
+
+    st.info("🎉 Processing complete! You can now download your results.")
+    zip_files = result['zip_files']
+    st.download_button(
+        label=zip_label,
+        data=lambda: zip_bytes(zip_files),  # the archive is built when the button is clicked
+        file_name="streamlit_output.zip",
+        mime="application/zip",
+        on_click="ignore",  # keep the results on the page while the archive downloads
+    )
 
 tab1, tab2 = st.tabs(["📄 Excel Upload Workflow", "📁 Manual Image Upload"])
 
@@ -26,8 +275,6 @@ with tab1:
     # ========== STEP 1: Upload Excel File ==========
     uploaded_excel = st.file_uploader("Upload Excel file with photo URLs", type=["xlsx"])
     if uploaded_excel:
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
-
         df = load_excel(uploaded_excel)
         st.success("Excel loaded!")
         st.dataframe(df.head())
@@ -38,69 +285,15 @@ with tab1:
             ["Download", "Crop", "Resize", "Validate"],
             default=["Download", "Crop", "Resize", "Validate"]
         )
+        face_crop = st.checkbox("🙂 Center the crop on the face", key="excel_face_crop",
+                                help="Needs OpenCV (pip install \"opencv-python-headless<5\"), otherwise photos are center cropped")
 
+        # ========== STEP 3: Run Processing Steps in the background ==========
         if st.button("🚀 Run Selected Steps"):
-            profiles = extract_profile_data(
-                df, 
-                id_col="Confirmation_Number", 
-                url_col="Image_URL", 
-                photoname_col="Photo_Name"
-            )
-            
-            downloaded_dir = os.path.join(OUTPUT_DIR, "downloaded")
-            cropped_dir = os.path.join(OUTPUT_DIR, "cropped")
-            resized_dir = os.path.join(OUTPUT_DIR, "resized")
-
-            # ========== STEP 3: Run Processing Steps ==========
-            if "Download" in steps:
-                st.write("⬇️ Downloading photos...")
-                os.makedirs(downloaded_dir, exist_ok=True)
-                errors = download_photos(profiles, output_folder=downloaded_dir)
-                if errors:
-                    st.warning(f"{len(errors)} photos failed to download.")
-                else:
-                    st.success("All photos downloaded!")
-
-            if "Crop" in steps:
-                st.write("✂️ Cropping photos...")
-                os.makedirs(cropped_dir, exist_ok=True)
-                crop_photos_in_folder(downloaded_dir, cropped_dir)
-                st.success("Cropping completed!")
-
-            if "Resize" in steps:
-                st.write("📏 Resizing photos...")
-                os.makedirs(resized_dir, exist_ok=True)
-                resize_photos_in_folder(cropped_dir, resized_dir)
-                st.success("Resizing completed!")
-
-            if "Validate" in steps:
-                st.write("🔍 Validating photos...")
-                results = validate_photos_in_folder(resized_dir)
-                st.dataframe(pd.DataFrame(results))
-                output_report = os.path.join(OUTPUT_DIR, "photo_validation_results.xlsx")
-                save_validation_results(results, output_report, merge_original_df=df, left_on="Photo_Name", right_on="Photo_Name")
-                st.success(f"Validation report saved: {output_report}")
-
-
-            # ========== STEP 4: ZIP Download ==========
-            zip_path = os.path.join(OUTPUT_DIR, "streamlit_output.zip")
-            if os.path.exists(zip_path):
-                os.remove(zip_path)
-
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for foldername, subfolders, filenames in os.walk(OUTPUT_DIR):
-                    for filename in filenames:
-                        file_path = os.path.join(foldername, filename)
-                        arcname = os.path.relpath(file_path, OUTPUT_DIR)
-                        zipf.write(file_path, arcname=arcname)
-
-            with open(zip_path, "rb") as f:
-                st.download_button(
-                    label="📦 Download All Results as ZIP",
-                    data=f,
-                    file_name="streamlit_output.zip",
-                    mime="application/zip"
-                )
+            submit_job("excel_job", run_excel_job, df, steps, "face" if face_crop else "center")
+
+    # ========== STEP 4: Progress, Results and ZIP Download ==========
+    show_job("excel_job", "📦 Download All Results as ZIP")
 
 
 # === 📁 Tab 2: Manual Image Upload ===
@@ -114,15 +307,6 @@ with tab2:
     )
 
     if uploaded_images:
-        os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-        # Save uploaded files to upload folder
-        upload_folder = os.path.join(UPLOAD_DIR, "uploaded")
-        os.makedirs(upload_folder, exist_ok=True)
-
-        for file in uploaded_images:
-            with open(os.path.join(upload_folder,file.name), "wb") as f:
-                f.write(file.read())
         st.success(f"Uploaded {len(uploaded_images)} images.")
 
         # Let user choose which processing to apply
@@ -131,50 +315,11 @@ with tab2:
             ["Crop", "Resize", "Validate"],
             default=["Crop", "Resize", "Validate"]
         )
+        face_crop = st.checkbox("🙂 Center the crop on the face", key="upload_face_crop",
+                                help="Needs OpenCV (pip install \"opencv-python-headless<5\"), otherwise photos are center cropped")
 
         if st.button("🚀 Process Uploaded Images"):
-            input_folder = upload_folder
-            cropped_folder = os.path.join(UPLOAD_DIR, "cropped")
-            resized_folder = os.path.join(UPLOAD_DIR, "resized")
-
-            if "Crop" in process_steps:
-                os.makedirs(cropped_folder, exist_ok=True)
-                st.write("✂️ Cropping photos...")
-                crop_photos_in_folder(input_folder, cropped_folder)
-                st.success("Cropping completed!")
-                input_folder = cropped_folder  # use cropped output for next step
-
-            if "Resize" in process_steps:
-                os.makedirs(resized_folder, exist_ok=True)
-                st.write("📏 Resizing photos...")
-                resize_photos_in_folder(input_folder, resized_folder)
-                st.success("Resizing completed!")
-
-            if "Validate" in process_steps:
-                st.write("🔍 Validating photos...")
-                validation_results = validate_photos_in_folder(resized_folder)
-                st.dataframe(pd.DataFrame(validation_results))
-                output_report = os.path.join(UPLOAD_DIR, "validation_results.xlsx")
-                save_validation_results(validation_results, output_report)
-                st.success(f"Validation report saved: {output_report}")
-
-            st.info("🎉 Processing complete! You can now download your results.")
-
-            zip_path = os.path.join(UPLOAD_DIR, "streamlit_output.zip")
-            if os.path.exists(zip_path):
-                os.remove(zip_path)
-
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for foldername, subfolders, filenames in os.walk(UPLOAD_DIR):
-                    for filename in filenames:
-                        file_path = os.path.join(foldername, filename)
-                        arcname = os.path.relpath(file_path, UPLOAD_DIR)
-                        zipf.write(file_path, arcname=arcname)
-
-            with open(zip_path, "rb") as f:
-                st.download_button(
-                    label="📦 Download Processed Images as ZIP",
-                    data=f,
-                    file_name="streamlit_output.zip",
-                    mime="application/zip"
-                )
\ No newline at end of file
+            uploads = [(file.name, file.getvalue()) for file in uploaded_images]
+            submit_job("upload_job", run_upload_job, uploads, process_steps, "face" if face_crop else "center")
+
+    show_job("upload_job", "📦 Download Processed Images as ZIP")
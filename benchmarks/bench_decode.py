@@ -0,0 +1,67 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.image_io import load_image
+from src.cropper import SUPPORTED_EXTS
+from src.pipeline import process_image
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare full-resolution processing with reduced-resolution (draft mode) decoding")
+    parser.add_argument("--input_folder", type=str, default="data/photos/demo_cats", help="Folder of photos to decode")
+    parser.add_argument("--max_dimension", type=int, nargs="+", default=[0, 1024, 512, 256],
+                        help="Longest sides to compare (0 = full decode)")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of passes over the folder")
+    parser.add_argument("--decode_only", action="store_true",
+                        help="Only decode the photos instead of running the full crop/resize pipeline")
+    parser.add_argument("--child", type=int, default=None, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB (Linux/macOS only).
+    """
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+def decode_folder(input_folder, max_dimension, repeat, decode_only):
+    """
+    Decode (or fully process) every photo in the folder repeat times and print 'seconds peak_rss_mb',
+    where peak_rss_mb is the peak RSS growth over the imports.
+    Runs in its own process so that peak RSS is not shared between settings.
+    """
+    baseline_rss = peak_rss_mb()
+    paths = [os.path.join(input_folder, f) for f in sorted(os.listdir(input_folder)) if f.lower().endswith(SUPPORTED_EXTS)]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for path in paths:
+            if decode_only:
+                load_image(path, max_dimension or None)
+            else:
+                with open(path, "rb") as f:
+                    process_image(f.read(), os.path.basename(path), max_dimension=max_dimension or None)
+    print(f"{time.perf_counter() - start} {peak_rss_mb() - baseline_rss}")
+
+def main():
+    args = parse_args()
+    if args.child is not None:
+        decode_folder(args.input_folder, args.child, args.repeat, args.decode_only)
+        return
+
+    print(f"{'max_dimension':>13} {'seconds':>9} {'peak RSS MB':>12}")
+    for max_dimension in args.max_dimension:
+        output = subprocess.check_output([
+            sys.executable, __file__, "--child", str(max_dimension),
+            "--input_folder", args.input_folder, "--repeat", str(args.repeat),
+        ] + (["--decode_only"] if args.decode_only else []), text=True)
+        seconds, rss = map(float, output.split())
+        print(f"{max_dimension or 'full':>13} {seconds:>9.2f} {rss:>12.1f}")
+
+if __name__ == "__main__":
+    main()
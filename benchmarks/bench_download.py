@@ -0,0 +1,38 @@
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.http_server import PhotoServer
+from src.downloader import download_photos
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark download_photos throughput against a local HTTP server")
+    parser.add_argument("--count", type=int, default=200, help="Number of photos to download")
+    parser.add_argument("--latency", type=float, default=0.05, help="Server latency per request in seconds")
+    parser.add_argument("--payload_kb", type=float, default=200, help="Size of each photo in KB")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32],
+                        help="Worker counts to compare")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    with PhotoServer(latency=args.latency, payload_kb=args.payload_kb) as server:
+        profiles = server.profiles(args.count)
+        print(f"{'workers':>8} {'seconds':>9} {'photos/s':>9} {'speedup':>8}")
+        baseline = None
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as output_folder:
+                start = time.perf_counter()
+                errors = download_photos(profiles, output_folder=output_folder, workers=workers, rate_limit=0)
+                elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"{workers:>8} {elapsed:>9.2f} {args.count / elapsed:>9.1f} {baseline / elapsed:>7.1f}x"
+                  + (f"  ({len(errors)} errors)" if errors else ""))
+
+if __name__ == "__main__":
+    main()
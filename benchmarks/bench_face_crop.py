@@ -0,0 +1,54 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.cache import ProcessingCache
+from src.cropper import crop_photos_in_folder
+from src.face_detect import load_detector
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare the cost of center crops and face-aware crops")
+    parser.add_argument("--input_folder", type=str, default="data/photos/demo_cats", help="Folder of photos to crop")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs per mode (best run is reported)")
+    parser.add_argument("--max_dimension", type=int, default=None, help="Longest side of the photos before cropping")
+    return parser.parse_args()
+
+def best_time(input_folder, repeat, **kwargs):
+    best = None
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as output_folder:
+            start = time.perf_counter()
+            with redirect_stdout(open(os.devnull, "w")):
+                crop_photos_in_folder(input_folder, output_folder, **kwargs)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    args = parse_args()
+    if load_detector() is None:
+        print("❌ The OpenCV face detector is not installed (pip install \"opencv-python-headless<5\"), face crops cannot be benchmarked.")
+        return
+
+    count = sum(1 for f in os.listdir(args.input_folder) if f.lower().endswith((".jpg", ".jpeg", ".png")))
+    center = best_time(args.input_folder, args.repeat, max_dimension=args.max_dimension)
+    face = best_time(args.input_folder, args.repeat, max_dimension=args.max_dimension, mode="face")
+
+    # Detections cached from a crop at another ratio: only the crop itself is redone
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ProcessingCache(cache_dir)
+        best_time(args.input_folder, 1, max_dimension=args.max_dimension, mode="face", target_ratio=1.0, cache=cache)
+        cached = best_time(args.input_folder, 1, max_dimension=args.max_dimension, mode="face", cache=cache)
+
+    print(f"{'mode':>22} {'seconds':>9} {'photos/s':>9} {'vs center':>10}")
+    for name, elapsed in [("center", center), ("face", face), ("face (cached faces)", cached)]:
+        print(f"{name:>22} {elapsed:>9.2f} {count / elapsed:>9.1f} {elapsed / center:>9.2f}x")
+
+if __name__ == "__main__":
+    main()
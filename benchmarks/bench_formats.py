@@ -0,0 +1,106 @@
+import argparse
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from PIL import Image
+from src.image_io import load_image
+from src.cropper import crop_image, SUPPORTED_EXTS
+from src.size_adjuster import OUTPUT_FORMATS, check_output_format, encode_image, fit_to_size
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare output formats: bytes at equal quality, encode time "
+                                                 "and size targeting")
+    parser.add_argument("--input_folder", type=str, default="data/photos/demo_cats", help="Folder of photos to encode")
+    parser.add_argument("--formats", nargs="+", choices=list(OUTPUT_FORMATS), default=list(OUTPUT_FORMATS),
+                        help="Output formats to compare (unsupported ones are skipped)")
+    parser.add_argument("--reference_quality", type=int, default=75,
+                        help="Baseline JPEG quality whose PSNR the other formats have to match (default: 75)")
+    parser.add_argument("--min_kb", type=float, default=50, help="Minimum output size in KB")
+    parser.add_argument("--max_kb", type=float, default=100, help="Maximum output size in KB for size targeting")
+    return parser.parse_args()
+
+def psnr(reference, data):
+    """
+    Peak signal-to-noise ratio in dB of encoded bytes against the reference pixels.
+    """
+    decoded = np.asarray(Image.open(io.BytesIO(data)).convert("RGB"), dtype=np.float32)
+    mse = np.mean((reference - decoded) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+def smallest_matching(img, reference, target_psnr, output_format):
+    """
+    Binary-search the lowest quality of output_format whose PSNR reaches target_psnr.
+    Returns (bytes, seconds spent encoding, number of encodes).
+    """
+    lo, hi = 1, 100
+    best = encode_image(img, 100, output_format)
+    seconds, encodes = 0.0, 0
+    while lo <= hi:
+        quality = (lo + hi) // 2
+        start = time.perf_counter()
+        data = encode_image(img, quality, output_format)
+        seconds += time.perf_counter() - start
+        encodes += 1
+        if psnr(reference, data) >= target_psnr:
+            best, hi = data, quality - 1
+        else:
+            lo = quality + 1
+    return best, seconds, encodes
+
+def main():
+    args = parse_args()
+    formats = []
+    for output_format in args.formats:
+        try:
+            check_output_format(output_format)
+            formats.append(output_format)
+        except ValueError as e:
+            print(f"⚠️ Skipping {output_format}: {e}")
+
+    images = []
+    for filename in sorted(os.listdir(args.input_folder)):
+        if filename.lower().endswith(SUPPORTED_EXTS):
+            images.append(crop_image(load_image(os.path.join(args.input_folder, filename))).convert("RGB"))
+    references = [np.asarray(img, dtype=np.float32) for img in images]
+    targets = [psnr(reference, encode_image(img, args.reference_quality, "jpeg"))
+               for img, reference in zip(images, references)]
+
+    print(f"Bytes at the PSNR of baseline JPEG quality {args.reference_quality} ({len(images)} photos), "
+          f"relative to {formats[0]}:")
+    print(f"{'format':>17} {'total KB':>9} {'saved':>8} {'ms/encode':>10}")
+    first_kb = None
+    for output_format in formats:
+        total_kb = seconds = encodes = 0
+        for img, reference, target in zip(images, references, targets):
+            data, spent, count = smallest_matching(img, reference, target, output_format)
+            total_kb += len(data) / 1024
+            seconds += spent
+            encodes += count
+        first_kb = first_kb or total_kb
+        print(f"{output_format:>17} {total_kb:>9.0f} {1 - total_kb / first_kb:>8.0%} {seconds / encodes * 1000:>10.0f}")
+
+    print(f"\nSize targeting into [{args.min_kb:g}, {args.max_kb:g}] KB:")
+    print(f"{'format':>17} {'fitted':>7} {'encodes':>8} {'seconds':>8} {'mean quality':>13}")
+    for output_format in formats:
+        fitted = encodes = 0
+        qualities = []
+        start = time.perf_counter()
+        for img in images:
+            fit = fit_to_size(img, args.min_kb, args.max_kb, output_format=output_format)
+            encodes += fit["encodes"]
+            if fit["data"] is not None:
+                fitted += 1
+                qualities.append(fit["quality"])
+        elapsed = time.perf_counter() - start
+        mean_quality = sum(qualities) / len(qualities) if qualities else 0
+        print(f"{output_format:>17} {fitted:>4}/{len(images):<2} {encodes:>8} {elapsed:>8.2f} {mean_quality:>13.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.cropper import crop_photos_in_folder
+from src.size_adjuster import resize_photos_in_folder
+from src.validator import validate_photos_in_folder
+from src.pipeline import process_photos_in_folder
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare the four-pass folder flow with the fused per-image pipeline")
+    parser.add_argument("--input_folder", type=str, default="data/photos/demo_cats", help="Folder of photos to process")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs per flow (best run is reported)")
+    return parser.parse_args()
+
+def read_io_counters():
+    """
+    Return (bytes read, bytes written) by this process so far, or None where /proc is not available.
+    """
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except OSError:
+        return None
+
+def four_pass(input_folder, work_folder):
+    cropped = os.path.join(work_folder, "cropped")
+    resized = os.path.join(work_folder, "resized")
+    crop_photos_in_folder(input_folder, cropped)
+    resize_photos_in_folder(cropped, resized)
+    return validate_photos_in_folder(resized)
+
+def fused(input_folder, work_folder):
+    results, _ = process_photos_in_folder(input_folder, os.path.join(work_folder, "processed"))
+    return results
+
+def measure(flow, input_folder, repeat):
+    best = None
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as work_folder:
+            io_before = read_io_counters()
+            start = time.perf_counter()
+            with redirect_stdout(open(os.devnull, "w")):
+                results = flow(input_folder, work_folder)
+            elapsed = time.perf_counter() - start
+            io_after = read_io_counters()
+        io_bytes = (io_after[0] - io_before[0], io_after[1] - io_before[1]) if io_before else (None, None)
+        if best is None or elapsed < best[0]:
+            best = (elapsed, io_bytes, len(results))
+    return best
+
+def main():
+    args = parse_args()
+
+    print(f"{'flow':>10} {'seconds':>9} {'read MB':>9} {'written MB':>11} {'validated':>10}")
+    for name, flow in [("four-pass", four_pass), ("fused", fused)]:
+        elapsed, (read_bytes, written_bytes), validated = measure(flow, args.input_folder, args.repeat)
+        read_mb = f"{read_bytes / 2**20:.1f}" if read_bytes is not None else "n/a"
+        written_mb = f"{written_bytes / 2**20:.1f}" if written_bytes is not None else "n/a"
+        print(f"{name:>10} {elapsed:>9.2f} {read_mb:>9} {written_mb:>11} {validated:>10}")
+
+if __name__ == "__main__":
+    main()
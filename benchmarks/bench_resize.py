@@ -0,0 +1,68 @@
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.image_io import load_image
+from src.cropper import crop_image, SUPPORTED_EXTS
+from src.size_adjuster import encode_image, fit_to_size
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare JPEG encodes needed by the linear and binary quality searches")
+    parser.add_argument("--input_folder", type=str, default="data/photos/demo_cats", help="Folder of photos to resize")
+    parser.add_argument("--min_kb", type=float, default=50, help="Minimum output size in KB")
+    parser.add_argument("--max_kb", type=float, nargs="+", default=[100, 200, 400],
+                        help="Maximum output sizes in KB to compare")
+    return parser.parse_args()
+
+def linear_fit(img, min_kb, max_kb):
+    """
+    The previous resize_photo search: start at quality 100 and step down by 5.
+    Returns (data or None, encodes).
+    """
+    quality = 100
+    data = encode_image(img, quality, "jpeg")
+    encodes = 1
+    size_kb = len(data) / 1024
+    if size_kb < min_kb:
+        return None, encodes
+    while size_kb > max_kb and quality > 4:
+        quality -= 5
+        data = encode_image(img, quality, "jpeg")
+        encodes += 1
+        size_kb = len(data) / 1024
+    return (data if size_kb <= max_kb else None), encodes
+
+def main():
+    args = parse_args()
+
+    images = []
+    for filename in sorted(os.listdir(args.input_folder)):
+        if filename.lower().endswith(SUPPORTED_EXTS):
+            images.append(crop_image(load_image(os.path.join(args.input_folder, filename))).convert("RGB"))
+
+    print(f"{'max_kb':>7} {'search':>8} {'encodes':>8} {'seconds':>8} {'fitted':>7} {'mean KB':>8}")
+    for max_kb in args.max_kb:
+        for name in ("linear", "binary"):
+            encodes = fitted = 0
+            total_kb = 0.0
+            start = time.perf_counter()
+            for img in images:
+                if name == "linear":
+                    data, count = linear_fit(img, args.min_kb, max_kb)
+                else:
+                    fit = fit_to_size(img, args.min_kb, max_kb)
+                    data, count = fit["data"], fit["encodes"]
+                encodes += count
+                if data is not None:
+                    fitted += 1
+                    total_kb += len(data) / 1024
+            elapsed = time.perf_counter() - start
+            mean_kb = total_kb / fitted if fitted else 0
+            print(f"{max_kb:>7g} {name:>8} {encodes:>8} {elapsed:>8.2f} {fitted:>4}/{len(images):<2} {mean_kb:>8.1f}")
+
+if __name__ == "__main__":
+    main()
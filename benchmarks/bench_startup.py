@@ -0,0 +1,89 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.http_server import PhotoServer
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+TOOLS = ("crop", "resize", "process", "validate", "download")
+# Dependencies that dominate startup when they are imported
+HEAVY_MODULES = ("pandas", "numpy", "requests", "openpyxl", "PIL.Image", "multiprocessing")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure CLI startup per tool with python -X importtime")
+    parser.add_argument("--tools", nargs="+", choices=TOOLS, default=list(TOOLS), help="Tools to measure")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per tool (best run is reported)")
+    parser.add_argument("--top", type=int, default=3, help="Number of slowest top-level imports to show per tool")
+    return parser.parse_args()
+
+def tool_args(tool, folder, base_url):
+    """
+    Command line running a tool on a single small photo, so the run time is mostly startup.
+    """
+    args = ["--tool", tool, "--no_cache", "--run_manifest", os.path.join(folder, "run_manifest.jsonl"),
+            "--validate_output_report", os.path.join(folder, "report.csv")]
+    if tool == "download":
+        report = os.path.join(folder, "report_in.csv")
+        with open(report, "w") as f:
+            f.write(f"Confirmation_Number,Image_URL,Photo_Name\n1,{base_url}/photo/1.jpg,photo_1\n")
+        return args + ["--download_input_report", report, "--download_photo_folder", os.path.join(folder, "downloaded")]
+    if tool == "validate":
+        return args + ["--validate_input_photo_folder", os.path.join(folder, "photos")]
+    return args + [f"--{tool}_input_photo_folder", os.path.join(folder, "photos"),
+                   f"--{tool}_output_photo_folder", os.path.join(folder, tool)]
+
+def parse_importtime(stderr):
+    """
+    Parse -X importtime output into (total import microseconds, {top-level module: cumulative microseconds},
+    set of all imported modules).
+    """
+    total, top_level, modules = 0, {}, set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        total += int(self_us)
+        modules.add(name.strip())
+        if not name[1:].startswith(" "):  # no extra indentation: imported directly by main
+            top_level[name.strip()] = int(cumulative_us)
+    return total, top_level, modules
+
+def measure(tool, folder, base_url, repeat):
+    """
+    Run a tool repeat times. Returns the best wall time and the import profile of the best run.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "main.py"] + tool_args(tool, folder, base_url),
+            cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        elapsed = time.perf_counter() - start
+        if completed.returncode:
+            raise RuntimeError(f"--tool {tool} failed:\n{completed.stderr[-2000:]}")
+        if best is None or elapsed < best[0]:
+            best = (elapsed, completed.stderr)
+    return best[0], parse_importtime(best[1])
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as folder, PhotoServer(latency=0, payload_kb=50) as server:
+        generate_corpus(os.path.join(folder, "photos"), count=1, width=600, height=800, kinds=("jpeg",))
+        print(f"{'tool':>9} {'wall ms':>8} {'import ms':>10}  {'heavy modules':<56} slowest imports")
+        for tool in args.tools:
+            elapsed, (total_us, top_level, modules) = measure(tool, folder, server.base_url, args.repeat)
+            heavy = ",".join(name for name in HEAVY_MODULES if name in modules) or "-"
+            slowest = sorted(top_level.items(), key=lambda item: -item[1])[:args.top]
+            slowest = " ".join(f"{name}={us / 1000:.0f}ms" for name, us in slowest)
+            print(f"{tool:>9} {elapsed * 1000:>8.0f} {total_us / 1000:>10.0f}  {heavy:<56} {slowest}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from PIL import Image
+from src.validator import validate_photos_in_folder
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare Pillow-based and header-only folder validation")
+    parser.add_argument("--count", type=int, default=20000, help="Number of photos in the synthetic folder")
+    parser.add_argument("--width", type=int, default=1536, help="Width of the synthetic photos")
+    parser.add_argument("--height", type=int, default=2048, help="Height of the synthetic photos")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (args.width, args.height), (200, 120, 60)).save(buffer, format="JPEG")
+    data = buffer.getvalue()
+
+    with tempfile.TemporaryDirectory() as folder:
+        for i in range(args.count):
+            with open(os.path.join(folder, f"photo_{i:06d}.jpg"), "wb") as f:
+                f.write(data)
+
+        print(f"{'mode':>8} {'seconds':>9} {'photos/s':>10}")
+        for name, fast in [("pillow", False), ("header", True)]:
+            start = time.perf_counter()
+            with redirect_stdout(open(os.devnull, "w")):
+                results = validate_photos_in_folder(folder, fast=fast)
+            elapsed = time.perf_counter() - start
+            assert len(results) == args.count
+            print(f"{name:>8} {elapsed:>9.2f} {args.count / elapsed:>10.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import os
+import random
+
+from PIL import Image
+
+# Kinds of photos the corpus can contain
+CORPUS_KINDS = ("jpeg", "png", "rgba", "rotated")
+# EXIF orientations used for the rotated kind (90/270 degrees, so width and height are swapped on load)
+ROTATED_ORIENTATIONS = (6, 8)
+
+def synthetic_photo(width, height, rng):
+    """
+    Build an RGB photo with smooth gradients and sensor-like noise, so it compresses like a real photo
+    rather than a flat color (which would make every encode unrealistically cheap).
+    """
+    base = Image.new("RGB", (2, 2))
+    base.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(4)])
+    gradient = base.resize((width, height), Image.BILINEAR)
+    noise = Image.effect_noise((width, height), rng.uniform(20, 60)).convert("RGB")
+    return Image.blend(gradient, noise, 0.25)
+
+def generate_corpus(folder, count=100, width=1536, height=2048, kinds=CORPUS_KINDS, seed=0):
+    """
+    Write a reproducible synthetic photo corpus to folder, cycling through the requested kinds:
+    'jpeg' (plain JPEG), 'png' (RGB PNG), 'rgba' (PNG with an alpha channel) and 'rotated'
+    (JPEG stored sideways with an EXIF orientation tag).
+    Sizes vary by up to ±10% around width x height so photos are not all identical.
+    :param folder: Output folder (created if needed)
+    :param count: Number of photos
+    :param width: Nominal width of the photos
+    :param height: Nominal height of the photos
+    :param kinds: Kinds of photos to include
+    :param seed: Random seed, the same seed always gives the same corpus
+    :return: List of the file paths written
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        kind = kinds[i % len(kinds)]
+        size = (round(width * rng.uniform(0.9, 1.1)), round(height * rng.uniform(0.9, 1.1)))
+        img = synthetic_photo(*size, rng)
+
+        if kind == "jpeg":
+            path = os.path.join(folder, f"photo_{i:06d}.jpg")
+            img.save(path, format="JPEG", quality=90)
+        elif kind == "rotated":
+            path = os.path.join(folder, f"photo_{i:06d}.jpg")
+            exif = Image.Exif()
+            exif[0x0112] = rng.choice(ROTATED_ORIENTATIONS)
+            img.transpose(Image.ROTATE_90).save(path, format="JPEG", quality=90, exif=exif)
+        elif kind == "png":
+            path = os.path.join(folder, f"photo_{i:06d}.png")
+            img.save(path, format="PNG", compress_level=1)
+        elif kind == "rgba":
+            path = os.path.join(folder, f"photo_{i:06d}.png")
+            img.putalpha(Image.linear_gradient("L").resize(size))
+            img.save(path, format="PNG", compress_level=1)
+        else:
+            raise ValueError(f"Unknown corpus kind: {kind}")
+        paths.append(path)
+    return paths
+
+def synthetic_report(count, base_url="http://127.0.0.1:8000", seed=0):
+    """
+    Build a report DataFrame shaped like the HR export (Confirmation_Number, Image_URL, Photo_Name
+    plus a few unrelated columns), for benchmarking extract_profile_data.
+    """
+    import pandas as pd
+
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        "Confirmation_Number": range(count),
+        "Image_URL": [f"{base_url}/photo/{i}.jpg" for i in range(count)],
+        "Photo_Name": [f"photo_{i:06d}" for i in range(count)],
+        "Department": [rng.choice(["HR", "IT", "Sales", "Finance"]) for _ in range(count)],
+        "Start_Date": ["2024-01-01"] * count,
+    })
@@ -0,0 +1,68 @@
+import os
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class PhotoRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serve a fixed payload for every GET after an artificial latency, like a slow image CDN.
+    Requests carrying a matching If-None-Match header get a 304 Not Modified.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        payload = self.server.payload
+        etag = self.server.etag
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+class PhotoServer:
+    """
+    Local HTTP stand-in for the photo host, running in a background thread.
+    :param latency: Seconds to wait before answering each request
+    :param payload_kb: Size of the served photo in KB
+    """
+    def __init__(self, latency=0.05, payload_kb=200):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), PhotoRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.payload = os.urandom(int(payload_kb * 1024))
+        self.httpd.etag = f'"{hashlib.sha1(self.httpd.payload).hexdigest()}"'
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def profiles(self, count):
+        """
+        Build a profile list pointing at this server, shaped like extract_profile_data output.
+        """
+        return [
+            {"id": i, "url": f"{self.base_url}/photo/{i}.jpg", "photoname": f"photo_{i:06d}"}
+            for i in range(count)
+        ]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,209 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.corpus import CORPUS_KINDS, generate_corpus, synthetic_report
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+BENCHMARKS = ("crop", "resize", "validate", "validate_fast", "validate_quality", "extract_profile_data", "download")
+# Metrics compared against the baseline, and whether higher values are better
+COMPARED_METRICS = {"items_per_sec": True, "peak_rss_mb": False, "encodes": False}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the pipeline benchmark suite on a synthetic corpus and compare "
+                                                 "the results with a stored baseline")
+    parser.add_argument("--count", type=int, default=24, help="Number of photos in the synthetic corpus")
+    parser.add_argument("--width", type=int, default=1536, help="Nominal width of the synthetic photos")
+    parser.add_argument("--height", type=int, default=2048, help="Nominal height of the synthetic photos")
+    parser.add_argument("--kinds", nargs="+", choices=CORPUS_KINDS, default=list(CORPUS_KINDS),
+                        help="Kinds of photos in the corpus (default: all)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the corpus")
+    parser.add_argument("--report_rows", type=int, default=200000, help="Rows of the report for extract_profile_data")
+    parser.add_argument("--download_count", type=int, default=200, help="Number of photos to download")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for crop/resize")
+    parser.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS),
+                        help="Benchmarks to run (default: all)")
+    parser.add_argument("--output", type=str, default=str(BENCHMARKS_DIR / "results" / "latest.json"),
+                        help="Path to save the results")
+    parser.add_argument("--baseline", type=str, default=str(BENCHMARKS_DIR / "baseline.json"),
+                        help="Baseline results to compare with")
+    parser.add_argument("--update_baseline", action="store_true", help="Save the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Relative change against the baseline reported as a regression (default: 0.2 = 20%%)")
+    parser.add_argument("--child", nargs=2, metavar=("BENCHMARK", "CORPUS"), default=None, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB (Linux/macOS only).
+    VmHWM is preferred on Linux: unlike ru_maxrss it is not inherited from the parent across exec.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+def run_benchmark(name, corpus_folder, args):
+    """
+    Run one benchmark and return (items processed, encodes, seconds). Runs in its own process (see main),
+    so that peak RSS is measured per benchmark. The seconds leave out the setup of the benchmark
+    (e.g. generating the report of extract_profile_data).
+    """
+    from src.metrics import RunMetrics
+
+    metrics = RunMetrics()
+    with tempfile.TemporaryDirectory() as work_folder:
+        start = time.perf_counter()
+        if name == "crop":
+            from src.cropper import crop_photos_in_folder
+            crop_photos_in_folder(corpus_folder, work_folder, workers=args.workers, metrics=metrics)
+        elif name == "resize":
+            from src.size_adjuster import resize_photos_in_folder
+            resize_photos_in_folder(corpus_folder, work_folder, workers=args.workers, metrics=metrics)
+        elif name == "validate":
+            from src.validator import validate_photos_in_folder
+            validate_photos_in_folder(corpus_folder, metrics=metrics)
+        elif name == "validate_fast":
+            from src.validator import validate_photos_in_folder
+            validate_photos_in_folder(corpus_folder, fast=True, metrics=metrics)
+        elif name == "validate_quality":
+            from src.validator import validate_photos_in_folder
+            validate_photos_in_folder(corpus_folder, fast=True, metrics=metrics, quality=True,
+                                      quality_workers=args.workers)
+        elif name == "extract_profile_data":
+            from src.parse_excel import extract_profile_data
+            df = synthetic_report(args.report_rows, seed=args.seed)
+            start = time.perf_counter()
+            profiles = extract_profile_data(df, "Confirmation_Number", "Image_URL", "Photo_Name")
+            return len(profiles), 0, time.perf_counter() - start
+        elif name == "download":
+            from benchmarks.http_server import PhotoServer
+            from src.downloader import download_photos
+            with PhotoServer(latency=0.02, payload_kb=200) as server:
+                download_photos(server.profiles(args.download_count), work_folder, workers=8, rate_limit=0,
+                                use_manifest=False, metrics=metrics)
+        seconds = time.perf_counter() - start
+
+    summary = metrics.summary()[0]
+    return summary["files"], summary["encodes"], seconds
+
+def child_main(args):
+    """
+    Entry point of the benchmark subprocess: prints the results as one JSON line.
+    """
+    name, corpus_folder = args.child
+    baseline_rss = peak_rss_mb()
+    with redirect_stdout(open(os.devnull, "w")):
+        items, encodes, seconds = run_benchmark(name, corpus_folder, args)
+    print(json.dumps({
+        "seconds": round(seconds, 3),
+        "items": items,
+        "items_per_sec": round(items / seconds, 2),
+        "peak_rss_mb": round(peak_rss_mb() - baseline_rss, 1),
+        "encodes": encodes,
+    }))
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with the baseline. Returns a list of (benchmark, metric, baseline value, value, change,
+    regressed) rows; change is relative (0.1 = 10% higher).
+    """
+    rows = []
+    for name, result in results["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if previous is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            before, after = previous.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            regressed = change < -tolerance if higher_is_better else change > tolerance
+            rows.append((name, metric, before, after, change, regressed))
+    return rows
+
+def main():
+    args = parse_args()
+    if args.child is not None:
+        child_main(args)
+        return
+
+    config = {
+        "count": args.count, "width": args.width, "height": args.height, "kinds": args.kinds, "seed": args.seed,
+        "report_rows": args.report_rows, "download_count": args.download_count, "workers": args.workers,
+    }
+    results = {
+        "config": config,
+        "machine": {
+            "platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count(),
+        },
+        "benchmarks": {},
+    }
+
+    with tempfile.TemporaryDirectory() as corpus_folder:
+        print(f"🧪 Generating {args.count} synthetic photos ({args.width}x{args.height}, {', '.join(args.kinds)})...")
+        generate_corpus(corpus_folder, args.count, args.width, args.height, args.kinds, args.seed)
+
+        child_args = [
+            "--count", str(args.count), "--seed", str(args.seed), "--report_rows", str(args.report_rows),
+            "--download_count", str(args.download_count), "--workers", str(args.workers),
+        ]
+        print(f"{'benchmark':>22} {'seconds':>8} {'items/s':>9} {'peak RSS MB':>12} {'encodes':>8}")
+        for name in args.benchmarks:
+            output = subprocess.check_output(
+                [sys.executable, __file__, "--child", name, corpus_folder] + child_args, text=True
+            )
+            result = json.loads(output.strip().splitlines()[-1])
+            results["benchmarks"][name] = result
+            print(f"{name:>22} {result['seconds']:>8.2f} {result['items_per_sec']:>9.1f} "
+                  f"{result['peak_rss_mb']:>12.1f} {result['encodes']:>8}")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"📊 Results saved to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"📌 Baseline updated: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"ℹ️ No baseline at {args.baseline}, run with --update_baseline to create one.")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("config") != config:
+        print("⚠️ The baseline was recorded with different settings, the comparison is only indicative.")
+    if baseline.get("machine") != results["machine"]:
+        print("⚠️ The baseline was recorded on another machine, timings may not be comparable.")
+
+    rows = compare(results, baseline, args.tolerance)
+    print(f"{'benchmark':>22} {'metric':>14} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, metric, before, after, change, regressed in rows:
+        flag = "  ❌ regression" if regressed else ""
+        print(f"{name:>22} {metric:>14} {before:>10g} {after:>10g} {change:>+8.0%}{flag}")
+    regressions = [row for row in rows if row[-1]]
+    if regressions:
+        print(f"❌ {len(regressions)} regressions beyond {args.tolerance:.0%} of the baseline.")
+        sys.exit(1)
+    print("✅ No regressions against the baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,191 @@
 import argparse
 from pathlib import Path
 
-from src.parse_excel import load_excel, extract_profile_data
+from src.parse_excel import load_report, extract_profile_data, iter_profile_batches
 from src.downloader import download_photos
 from src.validator import validate_photos_in_folder, save_validation_results
 from src.cropper import crop_photos_in_folder
 from src.size_adjuster import resize_photos_in_folder
+from src.pipeline import process_photos_in_folder
+from src.cache import ProcessingCache
+from src.metrics import RunMetrics, measure_stage
+from src.dedup import find_duplicate_groups, add_duplicate_groups
+from src.watcher import watch
+from src.run_manifest import RunManifest
+from src.sharding import parse_shard, shard_path, in_shard, merge_partial_reports
+from src.memory_budget import parse_memory_size, format_memory_size, peak_rss
 
 def parse_args():
     parser = argparse.ArgumentParser(description="🖼️ Profile Photo Processing Tool: Download, Validate, Crop, Resize")
     
-    parser.add_argument("--tool", choices=["download", "validate", "crop", "resize", "all"], default="all",
-                        help="Which tool to use: download, validate, crop, resize, or all (default: all)")
+    parser.add_argument("--tool", choices=["download", "validate", "crop", "resize", "process", "all", "merge"],
+                        default="all",
+                        help="Which tool to use: download, validate, crop, resize, process (crop + resize + validate "
+                             "in a single pass), all, or merge (combine the partial validation reports of a "
+                             "--shard run into --validate_output_report) (default: all)")
+    parser.add_argument("--shard", type=parse_shard, default=None,
+                        help="Only handle shard i of N (e.g. 1/4) of the photos, assigned by a hash of the photo "
+                             "name, so N nodes can share the input and output folders. Validation reports, run "
+                             "manifest and metrics report get a .shard-i-of-N suffix; combine the reports with "
+                             "--tool merge")
+
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes for crop/resize/process, 0 for one per CPU core (default: 1)")
+    parser.add_argument("--max_dimension", type=int, default=None,
+                        help="Longest side in pixels for cropped/resized photos. Large JPEGs are decoded directly "
+                             "at reduced resolution, which is much faster (default: keep full resolution)")
+    parser.add_argument("--max_memory", type=parse_memory_size, default=None,
+                        help="Memory budget of crop/resize/process, e.g. 2G or 512M: fewer workers and fewer photos "
+                             "in flight, estimated from their decoded size (width x height x bands) read from the "
+                             "file headers (default: no limit)")
+    parser.add_argument("--cache_dir", type=str, default=".photo_cache",
+                        help="Folder of the processing cache, so unchanged photos are not cropped/resized again "
+                             "(default: .photo_cache)")
+    parser.add_argument("--cache_max_mb", type=float, default=1024,
+                        help="Maximum size of the processing cache in MB, least recently used photos are evicted "
+                             "first (default: 1024)")
+    parser.add_argument("--no_cache", action="store_true", help="Disable the processing cache")
+    parser.add_argument("--output_format", choices=["jpeg", "progressive_jpeg", "webp", "avif"], default="jpeg",
+                        help="Encoder of resized/processed photos: baseline jpeg, progressive_jpeg (optimized "
+                             "Huffman tables + progressive scans), webp or avif (when Pillow supports it). Each "
+                             "format gets its own quality search to reach the size range (default: jpeg)")
+    parser.add_argument("--subsampling", choices=["4:4:4", "4:2:2", "4:2:0"], default=None,
+                        help="Chroma subsampling of jpeg and progressive_jpeg outputs: 4:4:4 keeps sharper colours "
+                             "in larger files (default: Pillow's default for jpeg, 4:2:0 for progressive_jpeg)")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="Crop/resize/process photos showing the same image only once and copy the result to "
+                             "the duplicates, and add a duplicate_group column to the validation report")
+    parser.add_argument("--run_manifest", type=str, default="data/run_manifest.jsonl",
+                        help="Log of every photo's state per stage, written as photos finish, so an interrupted "
+                             "run can be resumed (default: data/run_manifest.jsonl)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue the run logged in --run_manifest: photos it finished or that failed are "
+                             "skipped, unless their input changed")
+    parser.add_argument("--retry_failed", action="store_true",
+                        help="Like --resume, but photos that failed are tried again (with the failure reasons "
+                             "logged in --run_manifest)")
+    parser.add_argument("--metrics_report", type=str, default=None,
+                        help="Save per-stage timings and throughput to this path: .json for the full run report "
+                             "with per-file records, .csv for the per-stage summary (default: off)")
 
     # Download
     parser.add_argument("--download_input_report", type=str, default="data/raw_reports/demo_profile_photo_report2.xlsx",
-                        help="Path to Excel input file")
+                        help="Path to the input report (Excel, CSV or Parquet)")
     parser.add_argument("--download_input_sheet", type=str, default="Sheet1", help="Name of the Excel sheet (default: Sheet1)")
     parser.add_argument("--download_photo_folder", type=str, default="photos/downloaded",
                         help="Folder to save downloaded photos")
+    parser.add_argument("--download_workers", type=int, default=8,
+                        help="Number of concurrent download threads (default: 8)")
+    parser.add_argument("--download_rate_limit", type=float, default=5.0,
+                        help="Maximum requests per second to each host, 0 for unlimited (default: 5)")
+    parser.add_argument("--stream_report", action="store_true",
+                        help="Stream the report in batches so downloads start before it is fully read. The "
+                             "validation report then only keeps the ID, URL and photo name columns")
+    parser.add_argument("--download_batch_size", type=int, default=1000,
+                        help="Number of report rows read per batch with --stream_report (default: 1000)")
 
     # Validation
     parser.add_argument("--validate_input_photo_folder", type=str, default="photos/downloaded",
                         help="Folder containing photos to validate")
     parser.add_argument("--validate_output_report", type=str, default="data/output_reports/photo_validation_results.xlsx",
                         help="Path to save the validation report Excel file")
+    parser.add_argument("--fast_validate", action="store_true",
+                        help="Validate from file headers only (no decoding) on a thread pool, and flag "
+                             "truncated/corrupt files in a 'status' column")
+    parser.add_argument("--quality_check", action="store_true",
+                        help="Add quality columns to the validation report (sharpness, brightness, contrast, clipped "
+                             "highlights/shadows, and ssim/psnr against the source photo for process or with "
+                             "--quality_source_folder), and a quality_issue column flagging blurry, over/underexposed "
+                             "or near-blank photos. Measured on 256 px copies of the photos")
+    parser.add_argument("--quality_source_folder", type=str, default=None,
+                        help="With --tool validate and --quality_check: folder of the photos the validated ones "
+                             "were made from (e.g. the cropped photos when validating resized ones), for ssim/psnr")
 
     # Crop
     parser.add_argument("--crop_input_photo_folder", type=str, default="photos/demo_raw")
     parser.add_argument("--crop_output_photo_folder", type=str, default="photos/demo_cropped",
                         help="Folder to save cropped photos")
+    parser.add_argument("--crop_mode", choices=["center", "face"], default="center",
+                        help="How crop/process place the crop box: center, or centered on the largest face "
+                             "(needs pip install \"opencv-python-headless<5\") (default: center)")
 
     # Resize
     parser.add_argument("--resize_input_photo_folder", type=str, default="photos/demo_cropped")
     parser.add_argument("--resize_output_photo_folder", type=str, default="photos/demo_resized",
                         help="Folder to save resized photos")
 
-    return parser.parse_args()
+    # Process (fused crop → resize → validate)
+    parser.add_argument("--process_input_photo_folder", type=str, default="photos/downloaded")
+    parser.add_argument("--process_output_photo_folder", type=str, default="photos/processed",
+                        help="Folder to save cropped and resized photos")
+
+    # Watch (long-running process mode)
+    parser.add_argument("--watch", action="store_true",
+                        help="Instead of running --tool once, keep running: crop, resize and validate new photos "
+                             "dropped into --process_input_photo_folder (saved to --process_output_photo_folder) "
+                             "and append them to --watch_output_report. Stop with Ctrl+C. Not combinable with "
+                             "--shard, --resume, --retry_failed or --dedupe")
+    parser.add_argument("--watch_report_folder", type=str, default=None,
+                        help="With --watch, also download the photos of new reports dropped into this folder "
+                             "into --process_input_photo_folder (default: off)")
+    parser.add_argument("--watch_output_report", type=str, default="data/output_reports/watch_validation_results.csv",
+                        help="Rolling CSV validation report appended to by --watch")
+    parser.add_argument("--watch_interval", type=float, default=2.0,
+                        help="Seconds between two scans of the watched folders (default: 2)")
+    parser.add_argument("--watch_queue_size", type=int, default=64,
+                        help="Maximum number of photos waiting between two stages; scans and downloads wait "
+                             "when processing falls behind (default: 64)")
+
+    args = parser.parse_args()
+    if args.watch and (args.shard or args.resume or args.retry_failed or args.dedupe):
+        parser.error("--watch does not support --shard, --resume, --retry_failed or --dedupe")
+    if args.subsampling and args.output_format not in ("jpeg", "progressive_jpeg"):
+        parser.error("--subsampling only applies to the jpeg and progressive_jpeg output formats")
+    return args
+
+def print_errors(errors, action):
+    """
+    Print a summary of the per-file error records returned by the processing tools.
+    """
+    if not errors:
+        return
+    print(f"⚠️ {len(errors)} photos failed to {action}:")
+    for error in errors:
+        print(f"   ❌ {error['file']}: {error['error']}")
+
+def print_metrics(metrics):
+    """
+    Print the per-stage summary of a run.
+    """
+    print(f"⏱️ {'stage':<12} {'files':>6} {'failed':>6} {'seconds':>8} {'img/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for row in metrics.summary():
+        values = [row['images_per_sec'], row['p50_ms'], row['p95_ms'], row['p99_ms']]
+        values = [f"{value:>8}" if value is not None else f"{'-':>8}" for value in values]
+        print(f"   {row['stage']:<12} {row['files']:>6} {row['failures']:>6} {row['wall_seconds']:>8} {' '.join(values)}")
+
+def print_run_summary(cache, metrics, metrics_report, max_memory=None):
+    """
+    Print the processing cache statistics, the peak memory use and the per-stage summary, and save the run report.
+    """
+    if cache and cache.hits + cache.misses:
+        print(f"🗃️ Processing cache: {cache.summary()}")
+    main_rss, worker_rss = peak_rss()
+    if main_rss:
+        print(f"🧠 Peak RSS: {format_memory_size(main_rss)}"
+              + (f", largest worker {format_memory_size(worker_rss)}" if worker_rss else ""))
+        if max_memory and max(main_rss, worker_rss) > max_memory:
+            print(f"⚠️ A process went over --max_memory {format_memory_size(max_memory)}.")
+    if metrics:
+        print_metrics(metrics)
+        metrics.save(metrics_report)
+
+def keep_profiles(batches, profile_records):
+    """
+    Yield the profiles of a batch stream one by one, keeping them (as small dicts) for the validation report.
+    """
+    for batch in batches:
+        profile_records.extend(batch)
+        yield from batch
 
 def main():
     args = parse_args()
@@ -45,58 +194,161 @@ def main():
     download_input_report_path = Path(args.download_input_report)
     download_photo_folder = Path(args.download_photo_folder)
     validate_input_photo_folder = Path(args.validate_input_photo_folder)
-    validate_output_report_path = Path(args.validate_output_report)
+    validate_output_report_path = Path(shard_path(args.validate_output_report, args.shard))
     crop_input_photo_folder = Path(args.crop_input_photo_folder)
     crop_output_photo_folder = Path(args.crop_output_photo_folder)
     resize_input_photo_folder = Path(args.resize_input_photo_folder)
     resize_output_photo_folder = Path(args.resize_output_photo_folder)
+    process_input_photo_folder = Path(args.process_input_photo_folder)
+    process_output_photo_folder = Path(args.process_output_photo_folder)
 
     df = None
     profile_records = None
+    cache = None if args.no_cache else ProcessingCache(args.cache_dir, max_bytes=int(args.cache_max_mb * 2**20))
+    metrics = RunMetrics() if args.metrics_report else None
+    metrics_report = shard_path(args.metrics_report, args.shard)
+
+    if args.watch:
+        watch(
+            process_input_photo_folder, process_output_photo_folder, args.watch_output_report,
+            report_folder=args.watch_report_folder, report_sheet=args.download_input_sheet,
+            interval=args.watch_interval, queue_size=args.watch_queue_size, workers=args.workers,
+            max_dimension=args.max_dimension, cache=cache, metrics=metrics, crop_mode=args.crop_mode,
+            download_workers=args.download_workers, rate_limit=args.download_rate_limit,
+            output_format=args.output_format, max_memory=args.max_memory, subsampling=args.subsampling,
+        )
+        print_run_summary(cache, metrics, metrics_report, args.max_memory)
+        return
 
+    if args.tool == "merge":
+        merge_partial_reports(args.validate_output_report)
+        return
+
+    run_manifest_path = shard_path(args.run_manifest, args.shard)
+    run_manifest = None
+    if args.tool in ["download", "crop", "resize", "process", "all"]:  # the tools that log their photos
+        run_manifest = RunManifest(run_manifest_path, resume=args.resume, retry_failed=args.retry_failed)
     # === Tool 1: Download Photos + Validation ===
     if args.tool in ["download", "all"]:
-        df = load_excel(download_input_report_path, sheet_name=args.download_input_sheet)
-        if df is None:
-            print("❌ Failed to load Excel file. Exiting.")
-            return
-
-        profile_records = extract_profile_data(
-            df,
-            id_col="Confirmation_Number",
-            url_col="Image_URL",
-            photoname_col="Photo_Name",
-        )
+        if args.stream_report:
+            profile_records = []
+            batches = iter_profile_batches(
+                download_input_report_path,
+                sheet_name=args.download_input_sheet,
+                batch_size=args.download_batch_size,
+                id_col="Confirmation_Number",
+                url_col="Image_URL",
+                photoname_col="Photo_Name",
+            )
+            profiles = keep_profiles(batches, profile_records)
+            print("⬇️ Downloading photos while reading the report...")
+        else:
+            with measure_stage(metrics, "load_report"):
+                df = load_report(download_input_report_path, sheet_name=args.download_input_sheet)
+                if df is None:
+                    print("❌ Failed to load Excel file. Exiting.")
+                    return
+
+                profile_records = extract_profile_data(
+                    df,
+                    id_col="Confirmation_Number",
+                    url_col="Image_URL",
+                    photoname_col="Photo_Name",
+                )
+            profiles = profile_records
+            print(f"⬇️ Downloading {len(profile_records)} photos...")
 
-        print(f"⬇️ Downloading {len(profile_records)} photos...")
-        error_list = download_photos(profile_records, output_folder=download_photo_folder, sleep_time=0.2)
+        error_list = download_photos(
+            profiles,
+            output_folder=download_photo_folder,
+            workers=args.download_workers,
+            rate_limit=args.download_rate_limit,
+            metrics=metrics,
+            run_manifest=run_manifest,
+            shard=args.shard,
+        )
+        skipped_failures = run_manifest.skipped_failures.get("download", [])
         if error_list:
             print(f"⚠️ {len(error_list)} photo downloads failed.")
             print(f"Failed downloads: {error_list}")
-        else:
+        if skipped_failures:
+            print(f"⚠️ {len(skipped_failures)} photos that failed to download in a previous run were skipped: "
+                  f"{skipped_failures}")
+        if not error_list and not skipped_failures:
             print("✅ All photos downloaded successfully.")
 
+        if df is None:
+            import pandas as pd  # imported on first use, so tools that never read a report start fast
+
+            df = pd.DataFrame(profile_records, columns=["id", "url", "photoname"]).rename(
+                columns={"id": "Confirmation_Number", "url": "Image_URL", "photoname": "Photo_Name"}
+            )
+        if args.shard:
+            df = df[[in_shard(photoname, args.shard) for photoname in df["Photo_Name"]]]
+
         print("🔍 Validating the downloaded photos...")
-        validation_results = validate_photos_in_folder(download_photo_folder)
+        validation_results = validate_photos_in_folder(download_photo_folder, fast=args.fast_validate, metrics=metrics,
+                                                       shard=args.shard, quality=args.quality_check,
+                                                       quality_workers=args.workers)
+        if args.dedupe:
+            add_duplicate_groups(validation_results,
+                                 find_duplicate_groups(download_photo_folder, workers=args.workers, shard=args.shard))
         save_validation_results(validation_results, validate_output_report_path, merge_original_df=df, left_on="Photo_Name", right_on="Photo_Name")
 
     # === Tool 2: Validate Only ===
     if args.tool == "validate":
         print("🔍 Validating photos...")
-        validation_results = validate_photos_in_folder(validate_input_photo_folder)
+        validation_results = validate_photos_in_folder(validate_input_photo_folder, fast=args.fast_validate,
+                                                       metrics=metrics, shard=args.shard, quality=args.quality_check,
+                                                       source_folder=args.quality_source_folder,
+                                                       quality_workers=args.workers)
+        if args.dedupe:
+            add_duplicate_groups(validation_results,
+                                 find_duplicate_groups(validate_input_photo_folder, workers=args.workers,
+                                                       shard=args.shard))
         save_validation_results(validation_results, validate_output_report_path)
 
     # === Tool 3: Crop Photos ===
     if args.tool in ["crop", "all"]:
         print("✂️ Cropping photos...")
-        crop_photos_in_folder(crop_input_photo_folder, crop_output_photo_folder)
+        errors = crop_photos_in_folder(crop_input_photo_folder, crop_output_photo_folder,
+                                       workers=args.workers, max_dimension=args.max_dimension, cache=cache,
+                                       metrics=metrics, mode=args.crop_mode, dedupe=args.dedupe,
+                                       run_manifest=run_manifest, shard=args.shard, max_memory=args.max_memory)
+        print_errors(errors, "crop")
         print(f"✅ Cropped photos saved to {crop_output_photo_folder}")
 
     # === Tool 4: Resize Photos ===
     if args.tool in ["resize", "all"]:
         print("📏 Resizing photos...")
-        resize_photos_in_folder(resize_input_photo_folder, resize_output_photo_folder)
+        errors = resize_photos_in_folder(resize_input_photo_folder, resize_output_photo_folder,
+                                         workers=args.workers, max_dimension=args.max_dimension, cache=cache,
+                                         metrics=metrics, dedupe=args.dedupe, run_manifest=run_manifest,
+                                         output_format=args.output_format, shard=args.shard,
+                                         max_memory=args.max_memory, subsampling=args.subsampling)
+        print_errors(errors, "resize")
         print(f"✅ Resized photos saved to {resize_output_photo_folder}")
 
+    # === Tool 5: Crop + Resize + Validate in one pass ===
+    if args.tool == "process":
+        print("⚙️ Cropping, resizing and validating photos...")
+        validation_results, errors = process_photos_in_folder(
+            process_input_photo_folder, process_output_photo_folder,
+            workers=args.workers, max_dimension=args.max_dimension, cache=cache, metrics=metrics,
+            crop_mode=args.crop_mode, dedupe=args.dedupe, run_manifest=run_manifest,
+            output_format=args.output_format, shard=args.shard, max_memory=args.max_memory,
+            quality=args.quality_check, subsampling=args.subsampling,
+        )
+        print_errors(errors, "process")
+        print(f"✅ Processed photos saved to {process_output_photo_folder}")
+        save_validation_results(validation_results, validate_output_report_path)
+
+    if run_manifest:
+        run_manifest.close()
+        failed = sum(run_manifest.counts(stage).get('failed', 0) for stage in ('download', 'crop', 'resize', 'process'))
+        if failed:
+            print(f"📒 {failed} photos failed (reasons in {run_manifest_path}), run again with --retry_failed to retry them.")
+    print_run_summary(cache, metrics, metrics_report, args.max_memory)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,106 @@
+import os
+import json
+import hashlib
+from src.file_utils import atomic_open
+
+# Bump whenever a change to cropping/resizing would produce different output for the same input,
+# so that stale cache entries are never served.
+PIPELINE_VERSION = 1
+
+class ProcessingCache:
+    """
+    Persistent on-disk cache of processed photos, keyed by the content hash of the input photo
+    and the processing parameters. Entries are evicted least-recently-used first once the
+    cache grows beyond max_bytes.
+    The object is picklable, so it can be handed to worker processes; hit/miss counters are
+    kept by the caller through record().
+    :param cache_dir: Folder holding the cache entries
+    :param max_bytes: Maximum total size of the cache entries
+    """
+    def __init__(self, cache_dir, max_bytes=1024 * 2**20):
+        self.cache_dir = str(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, data, stage, *params):
+        """
+        Build the cache key for processing the photo bytes data in the given stage with params.
+        """
+        digest = hashlib.blake2b(data, digest_size=20)
+        digest.update(repr((PIPELINE_VERSION, stage) + params).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key):
+        """
+        Look up an entry. Returns a tuple (meta, data), or None if the key is not cached.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                meta = json.loads(f.readline())
+                data = f.read()
+            os.utime(path)  # mark as recently used for LRU eviction
+        except (OSError, ValueError):
+            return None
+        return meta, data
+
+    def put(self, key, data, meta=None):
+        """
+        Store the processed bytes data, with an optional JSON-serializable meta dictionary.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_open(path, 'wb') as f:
+            f.write(json.dumps(meta or {}).encode() + b'\n')
+            f.write(data)
+
+    def record(self, hit):
+        """
+        Count a lookup as a hit or a miss.
+        """
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def trim(self):
+        """
+        Evict the least recently used entries until the cache fits within max_bytes.
+        Returns the number of evicted entries.
+        """
+        entries = []
+        total = 0
+        for subfolder in os.scandir(self.cache_dir):
+            if not subfolder.is_dir():
+                continue
+            for entry in os.scandir(subfolder.path):
+                if entry.name.endswith('.part'):
+                    continue  # being written by another process
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        return evicted
+
+    def summary(self):
+        """
+        One-line summary of the hit/miss counters.
+        """
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups * 100 if lookups else 0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate)"
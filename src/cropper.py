@@ -1,10 +1,19 @@
 import os
-from PIL import Image, ImageOps
+import io
+import time
+from PIL import Image
+from src.image_io import load_image
+from src.face_detect import detect_faces_cached, face_center, resolve_crop_mode
+from src.parallel import map_photo_folder
+from src.file_utils import atomic_write_bytes
 
-def crop_to_aspect_ratio(image, target_ratio=0.75):
+SUPPORTED_EXTS = ('.jpg', '.jpeg', '.png')
+
+def crop_to_aspect_ratio(image, target_ratio=0.75, center=None):
     """
     Crop the image to the desired aspect ratio (e.g. 0.75 = 3:4).
-    Center crop only. Returns a new cropped image.
+    The crop box is centered on center, an (x, y) point given as fractions of the image size
+    (e.g. a face), as far as the image borders allow; center crop if None. Returns a new cropped image.
     """
     width, height = image.size
     current_ratio = width / height
@@ -15,38 +24,112 @@ def crop_to_aspect_ratio(image, target_ratio=0.75):
     if current_ratio > target_ratio:
         # too wide → crop width
         new_width = int(height * target_ratio)
-        left = (width - new_width) // 2
+        left = _box_start(width, new_width, center[0] if center else None)
         box = (left, 0, left + new_width, height)
     else:
         # too tall → crop height
         new_height = int(width / target_ratio)
-        top = (height - new_height) // 2
+        top = _box_start(height, new_height, center[1] if center else None)
         box = (0, top, width, top + new_height)
 
     return image.crop(box)
 
-def crop_photos_in_folder(input_folder, output_folder, target_ratio=0.75):
+def _box_start(size, new_size, center):
+    """
+    Start of a crop window of new_size along an axis of size, centered on the center fraction if given.
+    """
+    if center is None:
+        return (size - new_size) // 2
+    return min(max(0, round(center * size - new_size / 2)), size - new_size)
+
+def crop_image(img, target_ratio=0.75, center=None):
+    """
+    Crop an already decoded (and EXIF-transposed) image and make it safe to save as JPEG.
+    """
+    cropped_img = crop_to_aspect_ratio(img, target_ratio, center)
+
+    # 🔥 Convert RGBA → RGB if needed
+    if cropped_img.mode == 'RGBA':
+        cropped_img = cropped_img.convert('RGB')
+    return cropped_img
+
+def crop_photo(input_path, output_path, target_ratio=0.75, max_dimension=None, cache=None, mode="center"):
+    """
+    Crop a single photo file to the target aspect ratio and save it to output_path.
+    With mode="face" the crop is centered on the largest detected face (see face_detect).
+    If max_dimension is given, the photo is decoded at reduced resolution (see load_image).
+    If a ProcessingCache is given, the cropped photo is served from / stored in it.
+    Returns a dictionary with 'cache_hit', 'bytes_in', 'bytes_out' and 'encodes'.
+    """
+    with open(input_path, 'rb') as f:
+        data = f.read()
+    ext = os.path.splitext(output_path)[1].lower()
+
+    mode = resolve_crop_mode(mode)
+    key = cache.make_key(data, 'crop', ext, target_ratio, max_dimension, mode) if cache else None
+    entry = cache.get(key) if cache else None
+    if entry is not None:
+        output = entry[1]
+    else:
+        img = load_image(io.BytesIO(data), max_dimension)
+        center = face_center(detect_faces_cached(data, img, cache)) if mode == 'face' else None
+        cropped_img = crop_image(img, target_ratio, center)
+        buffer = io.BytesIO()
+        cropped_img.save(buffer, format=Image.registered_extensions()[ext])
+        output = buffer.getvalue()
+        if cache:
+            cache.put(key, output)
+
+    atomic_write_bytes(output_path, output)
+    return {'cache_hit': entry is not None, 'bytes_in': len(data), 'bytes_out': len(output),
+            'encodes': 0 if entry is not None else 1}
+
+def _crop_task(task):
+    """
+    Crop one file for crop_photos_in_folder. Returns a per-file record with 'file', 'ok', 'error',
+    'seconds', 'bytes_in', 'bytes_out', 'encodes' and 'cache_hit'.
+    """
+    input_path, output_path, target_ratio, max_dimension, cache, mode = task
+    start = time.perf_counter()
+    record = {'file': os.path.basename(input_path), 'ok': True, 'error': None, 'cache_hit': False}
+    try:
+        record.update(crop_photo(input_path, output_path, target_ratio, max_dimension, cache, mode))
+    except Exception as e:
+        record.update(ok=False, error=str(e))
+    record['seconds'] = time.perf_counter() - start
+    return record
+
+def crop_photos_in_folder(input_folder, output_folder, target_ratio=0.75, workers=1, max_dimension=None, cache=None,
+                          metrics=None, progress=None, mode="center", dedupe=False, run_manifest=None,
+                          shard=None, max_memory=None):
     """
     Crop all images in input_folder to the target aspect ratio.
     Save results in output_folder.
+    :param max_dimension: Longest side in pixels of the photos before cropping (None keeps full resolution)
+    :param workers: Number of worker processes (None or 0 = one per CPU core)
+    :param cache: Optional ProcessingCache; unchanged photos are then copied from it instead of re-cropped
+    :param metrics: Optional RunMetrics recording per-file timings under the 'crop' stage
+    :param progress: Optional callback called as progress(done, total) after each photo
+    :param mode: "center" for center crops, "face" to center the crops on the largest face (needs OpenCV)
+    :param dedupe: Process byte-identical photos (see dedup.split_duplicates) only once and copy the output
+                   to the duplicates
+    :param run_manifest: Optional RunManifest; photos finished by a previous run are skipped and each photo's
+                     outcome is recorded under the 'crop' stage as soon as it is cropped
+    :param shard: Optional (index, count) tuple from sharding.parse_shard; only the photos of that shard are cropped
+    :param max_memory: Optional memory budget in bytes; workers and photos in flight are limited to stay within
+                       it, by the estimated decoded size of each photo (see memory_budget)
+    :return: List of error records ({'file', 'stage', 'error'}) for photos that failed to crop
     """
     os.makedirs(output_folder, exist_ok=True)
-    SUPPORTED_EXTS = ('.jpg', '.jpeg', '.png')
 
     print(f"📂 Cropping photos in {input_folder} to aspect ratio {target_ratio}...")
-    for filename in os.listdir(input_folder):
-        if filename.lower().endswith(SUPPORTED_EXTS):
-            input_path = os.path.join(input_folder, filename)
-            output_path = os.path.join(output_folder, filename)
-            try:
-                with Image.open(input_path) as img:
-                    img = ImageOps.exif_transpose(img)
-                    cropped_img = crop_to_aspect_ratio(img, target_ratio)
-
-                    # 🔥 Convert RGBA → RGB if needed
-                    if cropped_img.mode == 'RGBA':
-                        cropped_img = cropped_img.convert('RGB')
-                    cropped_img.save(output_path)
-
-            except Exception as e:
-                print(f"❌ Failed to crop {filename}: {e}")
+    mode = resolve_crop_mode(mode)
+    results, _ = map_photo_folder(
+        'crop', _crop_task,
+        lambda filename: (os.path.join(input_folder, filename), os.path.join(output_folder, filename), target_ratio,
+                          max_dimension, cache, mode),
+        input_folder, SUPPORTED_EXTS, output_folder, workers=workers, max_dimension=max_dimension, cache=cache,
+        metrics=metrics, progress=progress, dedupe=dedupe, run_manifest=run_manifest, shard=shard,
+        max_memory=max_memory,
+    )
+    return [{'file': result['file'], 'stage': 'crop', 'error': result['error']} for result in results if not result['ok']]
@@ -0,0 +1,193 @@
+import hashlib
+import os
+import shutil
+from PIL import Image
+from src.image_io import load_image
+from src.parallel import map_in_workers, list_images
+from src.sharding import shard_filenames
+from src.validator import SUPPORTED_EXTS  # also the WebP/AVIF outputs of --output_format
+
+# Size of the difference hash: HASH_SIZE x HASH_SIZE bits
+HASH_SIZE = 8
+# Maximum Hamming distance between the hashes of two photos considered the same photo
+# (re-encodes, resizes and small crops of a photo usually stay within a few bits)
+DEFAULT_MAX_DISTANCE = 4
+# Photos are decoded at this size at most for hashing (JPEGs directly at reduced resolution)
+HASH_DECODE_DIMENSION = 128
+
+def dhash(img, hash_size=HASH_SIZE):
+    """
+    Difference hash of an image: shrink to (hash_size + 1) x hash_size grayscale pixels and
+    set one bit per pixel that is brighter than its right neighbour. Returns an int.
+    """
+    small = img.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def hamming_distance(a, b):
+    """
+    Number of differing bits between two hashes.
+    """
+    return bin(a ^ b).count('1')
+
+class BKTree:
+    """
+    Burkhard-Keller tree over hashes with the Hamming distance, for near-duplicate lookups
+    without comparing a hash with every other hash.
+    """
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, item):
+        """
+        Add a hash value with an associated item.
+        """
+        if self.root is None:
+            self.root = (value, item, {})
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, item, {})
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """
+        Return (distance, item) for every stored hash within max_distance of value.
+        """
+        found = []
+        pending = [self.root] if self.root is not None else []
+        while pending:
+            node_value, item, children = pending.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= max_distance:
+                found.append((distance, item))
+            # Triangle inequality: only subtrees at distance ± max_distance can hold matches
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    pending.append(child)
+        return found
+
+def _hash_task(path):
+    """
+    Hash one photo for find_duplicate_groups. Returns the hash, or None if the photo cannot be read.
+    """
+    try:
+        return dhash(load_image(path, HASH_DECODE_DIMENSION))
+    except Exception:
+        return None
+
+def find_duplicate_groups(folder, filenames=None, max_distance=DEFAULT_MAX_DISTANCE, workers=1, shard=None):
+    """
+    Group the photos of a folder that show the same image (same perceptual hash within max_distance).
+    :param folder: Folder containing the photos
+    :param filenames: Sorted names of the photos to compare (default: all photos in folder)
+    :param max_distance: Maximum Hamming distance between the dHashes of duplicates
+    :param workers: Number of worker processes used for hashing (None or 0 = one per CPU core)
+    :param shard: Optional (index, count) tuple from sharding.parse_shard; without filenames, only the photos
+                  of that shard are compared
+    :return: Dictionary mapping the filename of every photo in a group of two or more to the
+             first filename of its group (the group's representative)
+    """
+    if filenames is None:
+        filenames = shard_filenames(list_images(folder, SUPPORTED_EXTS), shard)
+    hashes = map_in_workers(_hash_task, [os.path.join(folder, filename) for filename in filenames], workers)
+
+    tree = BKTree()
+    group_of = {}
+    for filename, value in zip(filenames, hashes):
+        if value is None:
+            continue
+        matches = tree.search(value, max_distance)
+        if matches:
+            group_of[filename] = group_of[min(matches)[1]]
+        else:
+            tree.add(value, filename)
+            group_of[filename] = filename
+
+    members = {}
+    for filename, representative in group_of.items():
+        members.setdefault(representative, []).append(filename)
+    return {
+        filename: representative
+        for representative, group in members.items() if len(group) > 1
+        for filename in group
+    }
+
+def content_hash(path):
+    """
+    Hash of the bytes of a file, read in chunks.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+def split_duplicates(folder, filenames):
+    """
+    Split photos into the ones to process and the exact duplicates (byte-identical files with the same
+    extension) to copy the outputs to afterwards. Near duplicates (see find_duplicate_groups) are never
+    copied: profile photos of different people in front of the same background can have almost the
+    same perceptual hash, and copying would give one person another person's photo.
+    :return: Tuple (filenames to process, {duplicate filename: representative filename})
+    """
+    first = {}
+    duplicates = {}
+    for filename in filenames:
+        key = (os.path.splitext(filename)[1].lower(), content_hash(os.path.join(folder, filename)))
+        if key in first:
+            duplicates[filename] = first[key]
+        else:
+            first[key] = filename
+    unique = [filename for filename in filenames if filename not in duplicates]
+    return unique, duplicates
+
+def fan_out_outputs(results, duplicates, output_folder, fail_folder=None, output_name=None):
+    """
+    Copy the outputs of representatives to their duplicates and add a result record per duplicate.
+    Representatives that failed without writing an output (e.g. unreadable files) have nothing to copy:
+    their duplicates just get the failure record.
+    :param results: Per-file result records of the representatives (dictionaries with 'file' and 'ok')
+    :param duplicates: {duplicate filename: representative filename}, as returned by split_duplicates
+    :param output_folder: Folder the successful outputs were written to
+    :param fail_folder: Folder the failed outputs were written to (None if failures have no output)
+    :param output_name: Function giving the output filename of an input filename (default: the same name)
+    :return: All records sorted by filename: results plus one per duplicate (a copy of its representative's
+             record with 'file', 'seconds' set to 0, 'duplicate_of' and a renamed validation record)
+    """
+    output_name = output_name or (lambda filename: filename)
+    by_file = {result['file']: result for result in results}
+    fanned = list(results)
+    for duplicate, representative in duplicates.items():
+        record = dict(by_file[representative], file=duplicate, seconds=0, duplicate_of=representative,
+                      cache_hit=False, encodes=0)
+        folder = output_folder if record['ok'] else fail_folder
+        if folder is not None and os.path.exists(os.path.join(folder, output_name(representative))):
+            shutil.copyfile(os.path.join(folder, output_name(representative)),
+                            os.path.join(folder, output_name(duplicate)))
+        if record.get('validation') is not None:
+            record['validation'] = dict(record['validation'], Photo_Name=os.path.splitext(duplicate)[0])
+        fanned.append(record)
+    return sorted(fanned, key=lambda record: record['file'])
+
+def add_duplicate_groups(validation_records, groups):
+    """
+    Add a 'duplicate_group' column to validation records: the photo name of the group's representative
+    for photos that are duplicates of each other, None for the others.
+    :param groups: {filename: representative filename}, as returned by find_duplicate_groups
+    """
+    by_photoname = {os.path.splitext(filename)[0]: os.path.splitext(representative)[0]
+                    for filename, representative in groups.items()}
+    for record in validation_records:
+        record['duplicate_group'] = by_photoname.get(record['Photo_Name'])
+    return validation_records
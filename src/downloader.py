@@ -1,6 +1,19 @@
 import os
-import requests
+import json
+import shutil
 import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from src.file_utils import atomic_open
+from src.metrics import measure_stage
+from src.sharding import shard_profiles, shard_path
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+CHUNK_SIZE = 64 * 1024
+MANIFEST_NAME = ".download_manifest.json"
 
 def create_folder_if_not_exists(folder_path):
     """
@@ -9,36 +22,312 @@ def create_folder_if_not_exists(folder_path):
     if not os.path.exists(folder_path):
         os.makedirs(folder_path)
 
-def download_photos(profile_list, output_folder="photos/downloaded", sleep_time=0.3):
+class HostRateLimiter:
+    """
+    Token-bucket rate limiter with one bucket per host.
+    :param rate: Requests per second allowed for each host (None or 0 disables limiting)
+    :param burst: Maximum number of requests a host may receive back to back
+    """
+    def __init__(self, rate=None, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url):
+        """
+        Block until a token is available for the host of the given URL.
+        """
+        if not self.rate:
+            return
+        host = urlparse(url).netloc
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(host, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - last) * self.rate)
+                if tokens >= 1:
+                    self._buckets[host] = (tokens - 1, now)
+                    return
+                self._buckets[host] = (tokens, now)
+                wait = (1 - tokens) / self.rate
+            time.sleep(wait)
+
+def create_session(pool_size=10, max_retries=3, backoff_factor=0.5):
+    """
+    Create a pooled requests Session that retries 429/5xx responses with exponential backoff.
+    :param pool_size: Number of connections kept alive per host
+    :param max_retries: Number of retries for failed requests
+    :param backoff_factor: Base delay in seconds for the exponential backoff between retries
+    :return: Configured requests.Session
+    """
+    # requests is imported on first use, so tools that never download start fast
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def load_manifest(output_folder, name=MANIFEST_NAME):
+    """
+    Load the download manifest (ETag, Last-Modified, Content-Length per photo) from output_folder.
+    Returns an empty dict if there is no manifest yet or it cannot be read.
+    """
+    manifest_path = os.path.join(output_folder, name)
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest, output_folder, name=MANIFEST_NAME):
+    """
+    Save the download manifest to output_folder.
+    """
+    manifest_path = os.path.join(output_folder, name)
+    with atomic_open(manifest_path, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+
+def download_photo(session, profile, output_folder, rate_limiter=None, timeout=10, previous=None, metrics=None):
+    """
+    Download a single profile photo, streaming it to a temp file that is renamed into place.
+    If a manifest entry from a previous run is given, a conditional GET is sent and the
+    photo is left untouched when the server answers 304 Not Modified.
+    :param session: requests.Session used for the request
+    :param profile: Dictionary with 'id', 'url' and 'photoname' keys
+    :param output_folder: Folder to save the downloaded photo
+    :param rate_limiter: Optional HostRateLimiter applied before the request
+    :param timeout: Request timeout in seconds
+    :param previous: Manifest entry recorded for this photo by a previous run (optional)
+    :param metrics: Optional RunMetrics recording the download time, bytes and retries under the 'download' stage
+    :return: Tuple (status, manifest_entry); status is 'downloaded', 'unchanged' or 'failed'.
+             For failed downloads the entry only holds the 'error' message
+    """
+    url = profile["url"]
+    photoname = profile["photoname"]
+    id = profile["id"]
+    output_path = os.path.join(output_folder, f"{photoname}.jpg")
+
+    headers = {}
+    if previous and previous.get("url") == url and _matches_local_file(previous, output_path):
+        if previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
+
+    start = time.perf_counter()
+    status, entry, retries = "failed", None, 0
+    try:
+        if rate_limiter is not None:
+            rate_limiter.acquire(url)
+        with session.get(url, timeout=timeout, headers=headers, stream=True) as response:
+            retries = _retry_count(response)
+            if response.status_code == 304 and headers:
+                status, entry = "unchanged", previous
+                return status, entry
+            if response.status_code != 200:
+                raise IOError(f"HTTP {response.status_code} {response.reason}")
+
+            # Content-Length counts encoded bytes, so it can only be checked for identity-encoded bodies
+            expected_length = None
+            if "Content-Encoding" not in response.headers:
+                expected_length = response.headers.get("Content-Length")
+            written = 0
+            with atomic_open(output_path, "wb") as file:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    file.write(chunk)
+                    written += len(chunk)
+                if expected_length is not None and written != int(expected_length):
+                    raise IOError(f"Incomplete download: got {written} of {expected_length} bytes")
+
+            entry = {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "content_length": written,
+            }
+        status = "downloaded"
+        return status, entry
+
+    except Exception as e:
+        print(f"Error downloading {photoname} (ID: {id}): {e}. URL: {url}")
+        return "failed", {"error": str(e)}
+
+    finally:
+        if metrics is not None:
+            metrics.record(
+                "download", f"{photoname}.jpg", time.perf_counter() - start,
+                bytes_out=entry["content_length"] if status == "downloaded" else 0,
+                retries=retries, ok=status != "failed", cache_hit=status == "unchanged",
+            )
+
+def _retry_count(response):
+    """
+    Number of retries urllib3 made before getting this response.
+    """
+    retries = getattr(response.raw, "retries", None)
+    return len(retries.history) if retries is not None else 0
+
+def _matches_local_file(entry, path):
+    """
+    Check that the file from a previous run is still on disk with the recorded size.
+    """
+    try:
+        return os.path.getsize(path) == entry.get("content_length")
+    except OSError:
+        return False
+
+def download_photos(profile_list, output_folder="photos/downloaded", sleep_time=0.3, workers=1,
+                    rate_limit=None, max_retries=3, timeout=10, use_manifest=True, metrics=None, progress=None,
+                    skip_duplicate_urls=True, run_manifest=None, shard=None):
     """
     Download profile photos based on the provided profile data.
-    :param profile_list: List of dictionaries with 'url' and 'photoname' keys
+    :param profile_list: List (or any iterable, consumed lazily) of dictionaries with 'url' and 'photoname' keys
     :param output_folder: Folder to save the downloaded photos
-    :param sleep_time: Time to sleep between requests to avoid overwhelming the server
+    :param sleep_time: Minimum time between requests to the same host, used when rate_limit is not given
+    :param workers: Number of concurrent download threads
+    :param rate_limit: Maximum requests per second per host (0 disables limiting)
+    :param max_retries: Number of retries with backoff for 429/5xx responses and connection errors
+    :param timeout: Request timeout in seconds
+    :param use_manifest: Send conditional requests based on the manifest of previous runs and update it
+    :param metrics: Optional RunMetrics recording per-photo timings under the 'download' stage
+    :param progress: Optional callback called as progress(done, total) after each photo; total is None
+                     when profile_list has no length (e.g. a generator)
+    :param skip_duplicate_urls: Download each URL only once; profiles sharing a URL get a copy of the photo
+    :param run_manifest: Optional RunManifest; photos downloaded from the same URL by a previous run are skipped
+                         and each photo's outcome is recorded under the 'download' stage as soon as it is known
+    :param shard: Optional (index, count) tuple from sharding.parse_shard; only the photos of that shard are
+                  downloaded, and the shard keeps its own manifest so nodes sharing output_folder do not
+                  overwrite each other's
     :return: List of profiles that failed to download
     """
     create_folder_if_not_exists(output_folder)
 
-    error_list = []
+    if rate_limit is None:
+        rate_limit = 1 / sleep_time if sleep_time else 0
+    rate_limiter = HostRateLimiter(rate_limit)
+    workers = max(1, workers)
+    manifest_name = shard_path(MANIFEST_NAME, shard)
+    manifest = load_manifest(output_folder, manifest_name) if use_manifest else {}
+    profile_list = shard_profiles(profile_list, shard)
+    if run_manifest is not None:
+        profile_list = run_manifest.pending("download", profile_list, name=lambda profile: profile["photoname"],
+                                            signature=lambda profile: profile["url"])
+    total = len(profile_list) if hasattr(profile_list, "__len__") else None
 
-    for profile in profile_list:
-        url = profile["url"]
-        photoname = profile["photoname"]
-        id = profile["id"]
-
-        time.sleep(sleep_time)  # Sleep to avoid overwhelming the server
-        
-        try:
-            response = requests.get(url, timeout=10)
-            if response.status_code == 200:
-                output_path = os.path.join(output_folder, f"{photoname}.jpg")
-                with open(output_path, "wb") as file:
-                    file.write(response.content)
-
-        except Exception as e:
-            error_list.append(profile)
-            print(f"Error downloading {photoname} (ID: {id}): {e}. URL: {url}")
-            continue
+    duplicates = []
+    if skip_duplicate_urls:
+        if total is not None:
+            total = len({profile["url"] for profile in profile_list})
+        profile_list = _skip_duplicate_urls(profile_list, duplicates)
+
+    with create_session(pool_size=workers, max_retries=max_retries) as session:
+        def fetch(profile):
+            previous = manifest.get(str(profile["photoname"]))
+            return download_photo(session, profile, output_folder, rate_limiter, timeout, previous, metrics)
+
+        with measure_stage(metrics, "download"):
+            if workers == 1:
+                results = ((profile, fetch(profile)) for profile in profile_list)
+                error_list, unchanged = _collect_results(results, manifest, progress, total, run_manifest)
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    results = _submit_bounded(executor, fetch, profile_list, max_pending=workers * 4)
+                    error_list, unchanged = _collect_results(results, manifest, progress, total, run_manifest)
+
+    if duplicates:
+        duplicate_errors = _copy_duplicates(duplicates, error_list, manifest, output_folder)
+        if run_manifest is not None:
+            for profile, source in duplicates:
+                run_manifest.record("download", profile["photoname"], profile not in duplicate_errors,
+                                    f"Download of {source} (same URL) failed" if profile in duplicate_errors else None,
+                                    profile["url"])
+        error_list += duplicate_errors
+        print(f"♻️ {len(duplicates)} photos share their URL with another photo, downloaded once.")
+    if use_manifest:
+        save_manifest(manifest, output_folder, manifest_name)
+    if unchanged:
+        print(f"♻️ {unchanged} photos unchanged since the last run, skipped.")
 
     return error_list
-    
+
+def _skip_duplicate_urls(profiles, duplicates):
+    """
+    Yield the profiles whose URL was not seen before; the others are appended to duplicates
+    as (profile, photoname of the profile downloading the URL) pairs.
+    """
+    photoname_of = {}
+    for profile in profiles:
+        if profile["url"] in photoname_of:
+            duplicates.append((profile, photoname_of[profile["url"]]))
+        else:
+            photoname_of[profile["url"]] = profile["photoname"]
+            yield profile
+
+def _copy_duplicates(duplicates, error_list, manifest, output_folder):
+    """
+    Give each duplicate-URL profile a copy of the photo downloaded for its URL.
+    Returns the profiles whose URL failed to download.
+    """
+    failed = {str(profile["photoname"]) for profile in error_list}
+    errors = []
+    for profile, source in duplicates:
+        if str(source) in failed:
+            errors.append(profile)
+            continue
+        if str(profile["photoname"]) != str(source):
+            shutil.copyfile(
+                os.path.join(output_folder, f"{source}.jpg"),
+                os.path.join(output_folder, f"{profile['photoname']}.jpg"),
+            )
+        manifest[str(profile["photoname"])] = manifest.get(str(source))
+    return errors
+
+def _submit_bounded(executor, fn, items, max_pending):
+    """
+    Submit fn(item) for each item while keeping at most max_pending tasks in flight, so a lazily
+    produced item stream (e.g. from iter_profile_batches) is consumed only as fast as it is processed.
+    Yields (item, result) pairs in input order.
+    """
+    pending = deque()
+    for item in items:
+        pending.append((item, executor.submit(fn, item)))
+        if len(pending) >= max_pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+    while pending:
+        item, future = pending.popleft()
+        yield item, future.result()
+
+def _collect_results(results, manifest, progress=None, total=None, run_manifest=None):
+    """
+    Update the manifest from (profile, (status, entry)) pairs, reporting progress(done, total) if given
+    and recording each outcome in the run manifest if given.
+    Returns the error list and the number of unchanged photos.
+    """
+    error_list = []
+    unchanged = 0
+    for done, (profile, (status, entry)) in enumerate(results, 1):
+        if progress is not None:
+            progress(done, total)
+        if run_manifest is not None:
+            run_manifest.record("download", profile["photoname"], status != "failed",
+                                entry["error"] if status == "failed" else None, profile["url"])
+        if status == "failed":
+            error_list.append(profile)
+            continue
+        if status == "unchanged":
+            unchanged += 1
+        manifest[str(profile["photoname"])] = entry
+    return error_list, unchanged
@@ -0,0 +1,97 @@
+from PIL import Image
+
+# Longest side of the copy the detector runs on: faces in profile photos are large, so this is plenty
+DETECTION_MAX_DIMENSION = 256
+# Haar cascade shipped with OpenCV, and its detection settings (part of the detection cache key)
+HAAR_CASCADE = 'haarcascade_frontalface_default.xml'
+HAAR_PARAMS = {'scaleFactor': 1.15, 'minNeighbors': 5}
+# Smallest face, as a fraction of the shorter side of the photo. Faces fill a good part of a profile
+# photo, and skipping the small scales is what keeps detection cheap
+MIN_FACE_FRACTION = 0.15
+CROP_MODES = ('center', 'face')
+
+_detector = None
+_detector_loaded = False
+
+def load_detector():
+    """
+    Load the OpenCV Haar face detector once per process.
+    OpenCV is an optional dependency (pip install "opencv-python-headless<5"; OpenCV 5 no longer ships
+    the Haar cascades); without it None is returned and face crops fall back to center crops.
+    """
+    global _detector, _detector_loaded
+    if not _detector_loaded:
+        _detector_loaded = True
+        try:
+            import cv2  # optional dependency, only needed for face-aware crops
+            detector = cv2.CascadeClassifier(cv2.data.haarcascades + HAAR_CASCADE)
+        except (ImportError, AttributeError):
+            detector = None
+        if detector is None or detector.empty():
+            print("⚠️ The OpenCV face detector is not installed (pip install \"opencv-python-headless<5\"), "
+                  "using center crops instead of face crops.")
+        else:
+            cv2.setNumThreads(1)  # photos are already spread over worker processes
+            _detector = detector
+    return _detector
+
+def detect_faces(img):
+    """
+    Detect faces on a downscaled grayscale copy of an (EXIF-transposed) image.
+    :return: List of face boxes (left, top, right, bottom) as fractions of the image width and height,
+             largest face first. Empty if no face was found or OpenCV is not installed.
+    """
+    detector = load_detector()
+    if detector is None:
+        return []
+    import numpy as np
+
+    gray = img.convert('L')
+    gray.thumbnail((DETECTION_MAX_DIMENSION, DETECTION_MAX_DIMENSION), Image.BILINEAR)
+    width, height = gray.size
+    min_side = max(1, int(min(width, height) * MIN_FACE_FRACTION))
+    faces = detector.detectMultiScale(np.asarray(gray), minSize=(min_side, min_side), **HAAR_PARAMS)
+    boxes = [(x / width, y / height, (x + w) / width, (y + h) / height) for x, y, w, h in faces]
+    return sorted(boxes, key=lambda box: (box[2] - box[0]) * (box[3] - box[1]), reverse=True)
+
+def detect_faces_cached(data, img, cache=None):
+    """
+    detect_faces, with the detections stored in a ProcessingCache (if given) under the content hash
+    of the encoded photo. Boxes are resolution independent, so re-crops at other ratios or sizes reuse them.
+    :param data: Encoded bytes of the photo img was decoded from
+    :param img: Decoded (EXIF-transposed) image
+    :param cache: Optional ProcessingCache
+    """
+    if cache is None or load_detector() is None:
+        return detect_faces(img)
+    key = cache.make_key(data, 'faces', HAAR_CASCADE, sorted(HAAR_PARAMS.items()), DETECTION_MAX_DIMENSION,
+                         MIN_FACE_FRACTION)
+    entry = cache.get(key)
+    if entry is not None:
+        return [tuple(box) for box in entry[0]['faces']]
+    faces = detect_faces(img)
+    cache.put(key, b'', {'faces': faces})
+    return faces
+
+def face_center(faces):
+    """
+    Center (x, y) of the largest face as fractions of the image size, or None if there is no face.
+    """
+    if not faces:
+        return None
+    left, top, right, bottom = faces[0]
+    return (left + right) / 2, (top + bottom) / 2
+
+def resolve_crop_mode(mode):
+    """
+    Check a crop mode ('center' or 'face') and return the mode that will actually be used:
+    'face' falls back to 'center' when OpenCV is not installed.
+    Resolve the mode in the parent process and hand the result to the worker processes: unknown modes
+    are then rejected up front, and the warning about a missing detector is printed once instead of
+    once per worker.
+    """
+    if mode not in CROP_MODES:
+        raise ValueError(f"Unknown crop mode '{mode}', expected one of {', '.join(CROP_MODES)}")
+    if mode == 'face' and load_detector() is None:
+        return 'center'
+    return mode
@@ -0,0 +1,36 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+# mkstemp creates files as 0600; finished files get the usual umask-based permissions instead
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+@contextmanager
+def atomic_open(path, mode="wb"):
+    """
+    Open a temporary file next to path and move it into place only once writing has finished.
+    If anything fails while writing, the temporary file is removed and path is left untouched.
+    :param path: Final destination of the file
+    :param mode: File mode for the temporary file ('wb' or 'w')
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=f".{os.path.basename(path)}.", suffix=".part")
+    try:
+        with os.fdopen(fd, mode) as file:
+            yield file
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def atomic_write_bytes(path, data):
+    """
+    Write bytes to path atomically (temp file + rename).
+    """
+    with atomic_open(path, "wb") as file:
+        file.write(data)
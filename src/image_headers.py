@@ -0,0 +1,268 @@
+import os
+import struct
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_IEND = b'\x00\x00\x00\x00IEND\xaeB`\x82'
+JPEG_EOI = b'\xff\xd9'
+
+# Start-of-frame markers carrying the image size (SOF0-SOF15 except DHT, JPG and DAC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# EXIF orientations that rotate the photo by 90 or 270 degrees
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+# Channels of the decoded image per PNG color type (palette images are converted to RGB for output)
+PNG_BANDS = {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}
+# Bytes at the end of a PNG file searched for the end marker (some encoders append padding)
+TRAILER_SEARCH_BYTES = 64
+# Block sizes of the backwards search for the JPEG end marker: it is usually in the last few bytes, but
+# phone photos often carry data after it (Samsung SEFT trailers, Motion Photo videos), so it can be far
+# from the end of the file. Blocks start small and double up to the maximum
+JPEG_EOI_FIRST_BLOCK = 256
+JPEG_EOI_MAX_BLOCK = 64 * 1024
+
+class HeaderError(Exception):
+    """
+    Raised when an image header cannot be parsed.
+    """
+
+def read_image_header(path):
+    """
+    Read the dimensions of a JPEG, PNG, WebP or AVIF file from its header, without decoding any pixels.
+    Width and height are reported after applying the EXIF orientation, like ImageOps.exif_transpose.
+    :param path: Path of the image file
+    :return: Dictionary with 'format', 'width', 'height', 'bands' (channels of the decoded image), 'orientation',
+             'status' and 'error', where status is 'ok', 'truncated' (the end marker is missing) or 'corrupt'
+             (the header cannot be parsed)
+    """
+    with open(path, 'rb') as f:
+        signature = f.read(8)
+        try:
+            if signature[:2] == b'\xff\xd8':
+                f.seek(2)
+                header = _read_jpeg_header(f)
+                trailer = JPEG_EOI
+            elif signature == PNG_SIGNATURE:
+                header = _read_png_header(f)
+                trailer = PNG_IEND
+            elif signature[:4] == b'RIFF':
+                f.seek(0)
+                header = _read_webp_header(f)
+                trailer = None  # complete if the file is as long as its RIFF header says
+            elif signature[4:8] == b'ftyp':
+                f.seek(0)
+                header = _read_avif_header(f)
+                trailer = None  # complete if the file is as long as its boxes say
+            else:
+                raise HeaderError("unknown image format")
+        except (HeaderError, struct.error) as e:
+            return {'format': None, 'width': None, 'height': None, 'bands': None, 'orientation': None,
+                    'status': 'corrupt', 'error': str(e)}
+
+        if header['orientation'] in TRANSPOSED_ORIENTATIONS:
+            header['width'], header['height'] = header['height'], header['width']
+
+        if header['format'] == 'JPEG':
+            scan_offset = _find_jpeg_scan(f)
+            complete = scan_offset is not None and _find_backwards(f, JPEG_EOI, scan_offset)
+            error = "end of image marker not found"
+        elif trailer is None:
+            f.seek(0, os.SEEK_END)
+            complete = f.tell() >= header.pop('expected_size')
+            error = "file is shorter than its header says"
+        else:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - TRAILER_SEARCH_BYTES))
+            complete = trailer in f.read()
+            error = "end of image marker not found"
+        header['status'] = 'ok' if complete else 'truncated'
+        header['error'] = None if complete else error
+    return header
+
+def _read_exact(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise HeaderError("unexpected end of file in header")
+    return data
+
+def _read_jpeg_header(f):
+    orientation = 1
+    while True:
+        byte = _read_exact(f, 1)
+        if byte != b'\xff':
+            raise HeaderError("invalid JPEG marker")
+        marker = _read_exact(f, 1)[0]
+        while marker == 0xFF:  # fill bytes
+            marker = _read_exact(f, 1)[0]
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            continue  # standalone markers have no payload
+        if marker in (0xD9, 0xDA):
+            raise HeaderError("no frame header before image data")
+
+        length = struct.unpack('>H', _read_exact(f, 2))[0]
+        if length < 2:
+            raise HeaderError("invalid JPEG segment length")
+        if marker in JPEG_SOF_MARKERS:
+            _, height, width, bands = struct.unpack('>BHHB', _read_exact(f, 6))
+            if width == 0 or height == 0:
+                raise HeaderError("invalid JPEG dimensions")
+            f.seek(length - 8, os.SEEK_CUR)  # end of the frame header, see _find_jpeg_scan
+            return {'format': 'JPEG', 'width': width, 'height': height, 'bands': bands, 'orientation': orientation}
+        if marker == 0xE1:
+            segment = _read_exact(f, length - 2)
+            if segment.startswith(b'Exif\x00\x00'):
+                orientation = _exif_orientation(segment[6:]) or orientation
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+
+def _find_jpeg_scan(f):
+    """
+    Walk the JPEG segments from the end of the frame header to the first start-of-scan (SOS) marker.
+    Returns the offset of the SOS marker, or None if the file ends (or breaks) before it.
+    """
+    try:
+        while True:
+            if _read_exact(f, 1) != b'\xff':
+                return None
+            marker = _read_exact(f, 1)[0]
+            while marker == 0xFF:  # fill bytes
+                marker = _read_exact(f, 1)[0]
+            if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+                continue
+            if marker == 0xDA:
+                return f.tell() - 2
+            if marker == 0xD9:
+                return None
+            length = struct.unpack('>H', _read_exact(f, 2))[0]
+            f.seek(length - 2, os.SEEK_CUR)
+    except (HeaderError, struct.error):
+        return None
+
+def _find_backwards(f, marker, start):
+    """
+    Search a file for marker from its end back to offset start, in blocks of JPEG_EOI_FIRST_BLOCK bytes
+    doubling up to JPEG_EOI_MAX_BLOCK.
+    The entropy-coded data of a JPEG never holds 0xFF followed by anything but 0x00 or a restart marker,
+    so an end of image marker found after the first scan is the real one, whatever trails it.
+    """
+    f.seek(0, os.SEEK_END)
+    end = f.tell()
+    block = JPEG_EOI_FIRST_BLOCK
+    while end > start:
+        block_start = max(start, end - block)
+        f.seek(block_start)
+        if marker in f.read(end - block_start + len(marker) - 1):  # overlap: a marker across two blocks
+            return True
+        end = block_start
+        block = min(2 * block, JPEG_EOI_MAX_BLOCK)
+    return False
+
+def _exif_orientation(tiff):
+    """
+    Read the Orientation tag (0x0112) from IFD0 of a TIFF-structured EXIF block.
+    """
+    if tiff[:2] == b'II':
+        endian = '<'
+    elif tiff[:2] == b'MM':
+        endian = '>'
+    else:
+        return None
+    try:
+        ifd_offset = struct.unpack(endian + 'I', tiff[4:8])[0]
+        entry_count = struct.unpack(endian + 'H', tiff[ifd_offset:ifd_offset + 2])[0]
+        for i in range(entry_count):
+            entry = ifd_offset + 2 + i * 12
+            tag, _, _ = struct.unpack(endian + 'HHI', tiff[entry:entry + 8])
+            if tag == 0x0112:
+                value = struct.unpack(endian + 'H', tiff[entry + 8:entry + 10])[0]
+                return value if 1 <= value <= 8 else None
+    except struct.error:
+        return None
+    return None
+
+def _read_webp_header(f):
+    riff, riff_size, webp = struct.unpack('<4sI4s', _read_exact(f, 12))
+    if riff != b'RIFF' or webp != b'WEBP':
+        raise HeaderError("invalid WebP header")
+    chunk_type, _ = struct.unpack('<4sI', _read_exact(f, 8))
+    if chunk_type == b'VP8 ':
+        frame = _read_exact(f, 10)
+        if frame[3:6] != b'\x9d\x01\x2a':
+            raise HeaderError("invalid WebP VP8 frame")
+        width, height = (value & 0x3FFF for value in struct.unpack('<HH', frame[6:10]))
+        bands = 3
+    elif chunk_type == b'VP8L':
+        frame = _read_exact(f, 5)
+        if frame[0] != 0x2F:
+            raise HeaderError("invalid WebP VP8L frame")
+        bits = struct.unpack('<I', frame[1:5])[0]
+        width, height = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        bands = 4 if bits >> 28 & 1 else 3
+    elif chunk_type == b'VP8X':
+        canvas = _read_exact(f, 10)
+        width = int.from_bytes(canvas[4:7], 'little') + 1
+        height = int.from_bytes(canvas[7:10], 'little') + 1
+        bands = 4 if canvas[0] & 0x10 else 3
+    else:
+        raise HeaderError("unknown WebP chunk")
+    if width == 0 or height == 0:
+        raise HeaderError("invalid WebP dimensions")
+    return {'format': 'WEBP', 'width': width, 'height': height, 'bands': bands, 'orientation': 1,
+            'expected_size': riff_size + 8}
+
+def _read_avif_header(f):
+    """
+    Walk the top-level ISOBMFF boxes of an AVIF file and read the image size from the
+    meta → iprp → ipco → ispe box. The expected size is the end of the last box.
+    """
+    size = None
+    end = 0
+    while True:
+        box = f.read(8)
+        if len(box) < 8:
+            break
+        box_size, box_type = struct.unpack('>I4s', box)
+        header_size = 8
+        if box_size == 1:
+            box_size = struct.unpack('>Q', _read_exact(f, 8))[0]
+            header_size = 16
+        elif box_size == 0:
+            f.seek(0, os.SEEK_END)
+            box_size = f.tell() - end  # box runs to the end of the file
+        if box_size < header_size:
+            raise HeaderError("invalid AVIF box size")
+        if box_type == b'meta' and size is None:
+            size = _find_ispe(_read_exact(f, box_size - header_size)[4:])  # skip the full box version/flags
+        end += box_size
+        f.seek(end)
+    if size is None:
+        raise HeaderError("missing AVIF image size (ispe box)")
+    width, height = size
+    # The alpha plane is a separate item that is not looked for, assume there is one
+    return {'format': 'AVIF', 'width': width, 'height': height, 'bands': 4, 'orientation': 1, 'expected_size': end}
+
+def _find_ispe(data):
+    """
+    Find the first image spatial extents (ispe) box in the meta box payload, descending into iprp and ipco.
+    Returns (width, height) or None.
+    """
+    offset = 0
+    while offset + 8 <= len(data):
+        box_size, box_type = struct.unpack('>I4s', data[offset:offset + 8])
+        if box_size < 8:
+            return None
+        if box_type == b'ispe' and box_size >= 20:
+            return struct.unpack('>II', data[offset + 12:offset + 20])
+        if box_type in (b'iprp', b'ipco'):
+            found = _find_ispe(data[offset + 8:offset + box_size])
+            if found:
+                return found
+        offset += box_size
+    return None
+
+def _read_png_header(f):
+    length, chunk_type = struct.unpack('>I4s', _read_exact(f, 8))
+    if chunk_type != b'IHDR' or length < 8:
+        raise HeaderError("missing PNG IHDR chunk")
+    width, height, _, color_type = struct.unpack('>IIBB', _read_exact(f, 10))
+    if width == 0 or height == 0:
+        raise HeaderError("invalid PNG dimensions")
+    return {'format': 'PNG', 'width': width, 'height': height, 'bands': PNG_BANDS.get(color_type, 4), 'orientation': 1}
@@ -0,0 +1,42 @@
+import os
+from PIL import Image, ImageOps
+
+def load_image(source, max_dimension=None):
+    """
+    Open an image from a path or file object, apply its EXIF orientation and load the pixels.
+    The returned image no longer depends on the source file being open.
+    :param source: Path or file object of the image
+    :param max_dimension: If given, the image is downscaled so its longest side is at most this many
+                          pixels. JPEGs are decoded directly at 1/2, 1/4 or 1/8 scale (draft mode),
+                          which is much faster and uses far less memory than a full decode.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return load_image(f, max_dimension)
+
+    img = Image.open(source)
+    if max_dimension:
+        width, height = img.size
+        scale = max_dimension / max(width, height)
+        if scale < 1:
+            # Never drafts below the requested size, so the final resize below stays a downscale
+            img.draft(None, (max(1, int(width * scale)), max(1, int(height * scale))))
+    # Loads the pixels; in place, so upright photos are not copied once more at full size
+    ImageOps.exif_transpose(img, in_place=True)
+
+    if max_dimension:
+        img = shrink_to(img, max_dimension)
+    return img
+
+def shrink_to(img, max_dimension):
+    """
+    Downscale an image so that its longest side is at most max_dimension pixels.
+    Large factors are handled with a fast integer reduce(); the remaining factor is then below 2,
+    where bilinear resampling is both fast and sharp.
+    """
+    factor = max(img.size) // max_dimension
+    if factor >= 2:
+        img = img.reduce(factor)
+    if max(img.size) > max_dimension:
+        img.thumbnail((max_dimension, max_dimension), Image.BILINEAR)
+    return img
@@ -0,0 +1,151 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+class JobQueueFull(Exception):
+    """
+    Raised when a job is submitted while the job queue is full.
+    """
+
+class Job:
+    """
+    A batch submitted to the JobManager. The job function reports its progress through
+    job.progress(stage) callbacks, and the UI reads job.snapshot() to show counters and an ETA.
+    """
+    def __init__(self, job_id, session_id, folder):
+        self.id = job_id
+        self.session_id = session_id
+        self.folder = folder
+        self.status = 'queued'
+        self.stage = None
+        self.done = 0
+        self.total = None
+        self.stage_started = None
+        self.submitted = time.time()
+        self.finished = None
+        self.result = None
+        self.error = None
+
+    def progress(self, stage):
+        """
+        Return a progress(done, total) callback for the given stage, as taken by the processing functions.
+        """
+        def update(done, total):
+            if self.stage != stage:
+                self.stage, self.stage_started = stage, time.time()
+            self.done, self.total = done, total
+        return update
+
+    def snapshot(self):
+        """
+        Current state of the job as a dictionary: 'id', 'status', 'stage', 'done', 'total',
+        'eta_seconds' (None until it can be estimated), 'result' and 'error'.
+        """
+        eta = None
+        if self.status == 'running' and self.total and self.done:
+            elapsed = time.time() - self.stage_started
+            eta = elapsed / self.done * (self.total - self.done)
+        return {
+            'id': self.id, 'status': self.status, 'stage': self.stage, 'done': self.done, 'total': self.total,
+            'eta_seconds': eta, 'result': self.result, 'error': self.error,
+        }
+
+class JobManager:
+    """
+    Runs batches in the background on a bounded thread pool, each session in its own temporary workspace.
+    Workspaces of sessions that have not been seen for ttl_seconds are deleted, together with their jobs.
+    :param root_dir: Folder holding the session workspaces (default: a new temporary folder)
+    :param max_workers: Number of jobs running at the same time
+    :param max_pending: Maximum number of queued and running jobs; further submissions raise JobQueueFull
+    :param ttl_seconds: Time after the last access before a session workspace is deleted
+    """
+    def __init__(self, root_dir=None, max_workers=2, max_pending=8, ttl_seconds=3600):
+        self.root_dir = str(root_dir) if root_dir else tempfile.mkdtemp(prefix='photo-master-')
+        os.makedirs(self.root_dir, exist_ok=True)
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='photo-job')
+        self.jobs = {}
+        self.last_seen = {}
+        self._lock = threading.Lock()
+
+    def workspace(self, session_id):
+        """
+        Return the workspace folder of a session, creating it if needed, and mark the session as active.
+        """
+        folder = os.path.join(self.root_dir, session_id)
+        os.makedirs(folder, exist_ok=True)
+        with self._lock:
+            self.last_seen[session_id] = time.time()
+        return folder
+
+    def submit(self, session_id, func, *args, **kwargs):
+        """
+        Queue func(job, *args, **kwargs) to run in the background. The job gets its own folder
+        (job.folder) inside the session workspace for the artefacts of this run (e.g. its report); files that
+        later runs of the session build on belong in the workspace itself (see workspace).
+        The return value of func becomes job.result.
+        Returns the job id.
+        """
+        self.cleanup()
+        job_id = uuid.uuid4().hex[:12]
+        job = Job(job_id, session_id, os.path.join(self.root_dir, session_id, job_id))
+        with self._lock:
+            active = sum(1 for other in self.jobs.values() if other.status in ACTIVE_STATUSES)
+            if active >= self.max_pending:
+                raise JobQueueFull(f"{active} jobs are already queued or running, please try again later")
+            self.jobs[job_id] = job
+            self.last_seen[session_id] = time.time()
+        os.makedirs(job.folder, exist_ok=True)
+        self.executor.submit(self._run, job, func, args, kwargs)
+        return job_id
+
+    def _run(self, job, func, args, kwargs):
+        job.status = 'running'
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.status = 'done'
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'failed'
+        job.finished = time.time()
+
+    def get(self, job_id):
+        """
+        Return the snapshot of a job (see Job.snapshot), or None if it does not exist (anymore).
+        """
+        job = self.jobs.get(job_id)
+        return job.snapshot() if job else None
+
+    def session_jobs(self, session_id):
+        """
+        Snapshots of all jobs of a session, oldest first.
+        """
+        jobs = sorted((job for job in list(self.jobs.values()) if job.session_id == session_id),
+                      key=lambda job: job.submitted)
+        return [job.snapshot() for job in jobs]
+
+    def cleanup(self):
+        """
+        Delete the workspaces and jobs of sessions not seen for ttl_seconds, unless they still have active jobs.
+        Returns the number of deleted workspaces.
+        """
+        expired_before = time.time() - self.ttl_seconds
+        with self._lock:
+            busy = {job.session_id for job in self.jobs.values() if job.status in ACTIVE_STATUSES}
+            expired = [session_id for session_id, seen in self.last_seen.items()
+                       if seen < expired_before and session_id not in busy]
+            for session_id in expired:
+                del self.last_seen[session_id]
+                for job_id in [job_id for job_id, job in self.jobs.items() if job.session_id == session_id]:
+                    del self.jobs[job_id]
+
+        for session_id in expired:
+            shutil.rmtree(os.path.join(self.root_dir, session_id), ignore_errors=True)
+        return len(expired)
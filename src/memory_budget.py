@@ -0,0 +1,104 @@
+import os
+import re
+import sys
+from src.image_headers import read_image_header
+
+# Decoded copies of a photo alive at the same time while it is processed
+# (decoded pixels, crop or RGB conversion, downscaled retry and encoder buffers)
+COPIES_PER_PHOTO = 3
+# Decoded size per byte of file assumed when the header of a photo cannot be read
+FALLBACK_EXPANSION = 10
+MEMORY_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+def parse_memory_size(text):
+    """
+    Parse a memory size such as "2G", "1.5GB", "512M", "512MiB" or a plain number of bytes.
+    Units are binary (1K = 1024 bytes). Raises ValueError for malformed sizes.
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*', str(text), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid memory size '{text}', expected e.g. 2G or 512M")
+    size = int(float(match.group(1)) * MEMORY_UNITS[match.group(2).upper()])
+    if size <= 0:
+        raise ValueError(f"Invalid memory size '{text}', must be positive")
+    return size
+
+def format_memory_size(size):
+    """
+    Human-readable memory size, e.g. 1.5 GB or 300 MB.
+    """
+    if size >= MEMORY_UNITS['G']:
+        return f"{size / MEMORY_UNITS['G']:.1f} GB"
+    return f"{size / MEMORY_UNITS['M']:.0f} MB"
+
+def estimate_photo_memory(path, max_dimension=None):
+    """
+    Estimate the peak memory in bytes needed to process one photo, from its file header: the decoded size
+    (width × height × bands) times COPIES_PER_PHOTO. With max_dimension, JPEGs are decoded at reduced
+    resolution (see load_image), at most twice max_dimension; other formats are always decoded in full.
+    Photos whose header cannot be read are estimated from their file size.
+    """
+    try:
+        header = read_image_header(path)
+    except OSError:
+        return 0
+    if header['status'] == 'corrupt':
+        try:
+            return os.path.getsize(path) * FALLBACK_EXPANSION * COPIES_PER_PHOTO
+        except OSError:
+            return 0
+    width, height = header['width'], header['height']
+    if max_dimension and header['format'] == 'JPEG':
+        scale = min(1.0, 2 * max_dimension / max(width, height))
+        width, height = width * scale, height * scale
+    return int(width * height * header['bands'] * COPIES_PER_PHOTO)
+
+def current_rss():
+    """
+    Resident set size of this process in bytes, or None where it cannot be read (only Linux is supported).
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def peak_rss():
+    """
+    Peak resident set size in bytes of this process and of its largest finished worker process,
+    as a tuple (main, workers). Both are None where the platform does not report it (Windows).
+    """
+    try:
+        import resource  # Unix only
+    except ImportError:
+        return None, None
+    scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is in bytes on macOS, in KB elsewhere
+    main = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return main, workers
+
+def plan_workers(max_memory, workers, largest):
+    """
+    Fit the worker processes into a memory budget. Every process (this one, plus each worker when
+    there are several) is assumed to need as much as this process uses now; what is left is shared by
+    the photos in flight. Workers are dropped until the largest photo fits next to them.
+    :param max_memory: Memory budget in bytes
+    :param workers: Requested number of worker processes
+    :param largest: Estimated memory of the largest photo (see estimate_photo_memory)
+    :return: Tuple (number of workers, bytes left for the photos in flight)
+    """
+    base = current_rss() or 0
+
+    def photo_budget(count):
+        return max_memory - base * (count + 1 if count > 1 else 1)
+
+    requested = workers
+    while workers > 1 and photo_budget(workers) < largest:
+        workers -= 1
+    if workers < requested:
+        print(f"🧠 Memory budget {format_memory_size(max_memory)}: running {workers} workers instead of {requested}.")
+    if photo_budget(workers) < largest:
+        print(f"⚠️ Memory budget {format_memory_size(max_memory)} is below the estimated "
+              f"{format_memory_size(largest + max_memory - photo_budget(workers))} needed for the largest photo, "
+              f"processing one photo at a time.")
+    return workers, photo_budget(workers)
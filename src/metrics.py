@@ -0,0 +1,134 @@
+import csv
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from src.memory_budget import peak_rss
+
+SUMMARY_FIELDS = (
+    'stage', 'files', 'failures', 'wall_seconds', 'images_per_sec', 'p50_ms', 'p95_ms', 'p99_ms',
+    'bytes_in', 'bytes_out', 'encodes', 'retries', 'cache_hits',
+)
+
+class RunMetrics:
+    """
+    Collects per-file and per-stage timings and counters for a run, and writes them as a run report.
+    Processing functions take an optional metrics argument; when it is None nothing is recorded,
+    so instrumentation costs nothing unless it is switched on.
+    """
+    def __init__(self):
+        self.files = []
+        self.stage_seconds = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, file, seconds, bytes_in=0, bytes_out=0, encodes=0, retries=0, ok=True, cache_hit=None):
+        """
+        Record the processing of one file in a stage. Safe to call from several threads.
+        """
+        record = {
+            'stage': stage, 'file': file, 'seconds': seconds, 'bytes_in': bytes_in, 'bytes_out': bytes_out,
+            'encodes': encodes, 'retries': retries, 'ok': ok, 'cache_hit': cache_hit,
+        }
+        with self._lock:
+            self.files.append(record)
+
+    def record_results(self, stage, results):
+        """
+        Record the per-file result records returned by the processing workers
+        (dictionaries with 'file', 'seconds', 'ok' and optionally bytes/encodes/retries/cache_hit).
+        """
+        for result in results:
+            self.record(
+                stage, result['file'], result['seconds'],
+                bytes_in=result.get('bytes_in', 0), bytes_out=result.get('bytes_out', 0),
+                encodes=result.get('encodes', 0), retries=result.get('retries', 0),
+                ok=result['ok'], cache_hit=result.get('cache_hit'),
+            )
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Measure the wall time of a stage (added up if the stage runs several times).
+        """
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stage_seconds[name] = self.stage_seconds.get(name, 0) + elapsed
+
+    def summary(self):
+        """
+        Per-stage summary: file and failure counts, wall time, images/sec, p50/p95/p99 latency per file,
+        bytes in/out, encodes, retries and cache hits.
+        """
+        stages = list(self.stage_seconds)
+        stages += [record['stage'] for record in self.files if record['stage'] not in stages]
+        stages = list(dict.fromkeys(stages))
+
+        rows = []
+        for stage in stages:
+            records = [record for record in self.files if record['stage'] == stage]
+            latencies = sorted(record['seconds'] for record in records)
+            wall = self.stage_seconds.get(stage, sum(latencies))
+            rows.append({
+                'stage': stage,
+                'files': len(records),
+                'failures': sum(1 for record in records if not record['ok']),
+                'wall_seconds': round(wall, 3),
+                'images_per_sec': round(len(records) / wall, 2) if wall else None,
+                'p50_ms': _percentile_ms(latencies, 50),
+                'p95_ms': _percentile_ms(latencies, 95),
+                'p99_ms': _percentile_ms(latencies, 99),
+                'bytes_in': sum(record['bytes_in'] for record in records),
+                'bytes_out': sum(record['bytes_out'] for record in records),
+                'encodes': sum(record['encodes'] for record in records),
+                'retries': sum(record['retries'] for record in records),
+                'cache_hits': sum(1 for record in records if record['cache_hit']),
+            })
+        return rows
+
+    def save(self, output_path):
+        """
+        Save the run report. A .csv path gets the per-stage summary, any other path gets a JSON
+        document with the summary, the per-file records and the peak RSS of the run.
+        """
+        folder = os.path.dirname(str(output_path))
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        if str(output_path).lower().endswith('.csv'):
+            with open(output_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+                writer.writeheader()
+                writer.writerows(self.summary())
+        else:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                main_rss, worker_rss = peak_rss()
+                json.dump({'stages': self.summary(), 'files': self.files,
+                           'peak_rss': {'main': main_rss, 'largest_worker': worker_rss}}, f, indent=2)
+        print(f"📊 Run report saved to {output_path}")
+
+def _percentile_ms(sorted_values, percent):
+    """
+    Percentile (linear interpolation) of sorted values in seconds, returned in milliseconds.
+    """
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    value = sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+    return round(value * 1000, 2)
+
+@contextmanager
+def measure_stage(metrics, name):
+    """
+    metrics.stage(name) if metrics is given, otherwise a no-op.
+    """
+    if metrics is None:
+        yield None
+    else:
+        with metrics.stage(name):
+            yield metrics
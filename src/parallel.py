@@ -0,0 +1,174 @@
+import os
+from collections import deque
+from src.metrics import measure_stage
+from src.memory_budget import estimate_photo_memory
+from src.run_manifest import file_signature
+from src.sharding import shard_filenames
+
+def resolve_workers(workers):
+    """
+    Turn a workers setting into a process count: None or 0 means one worker per CPU core.
+    """
+    if not workers:
+        return os.cpu_count() or 1
+    return max(1, workers)
+
+def map_in_workers(func, items, workers=1, chunksize=None, progress=None, on_result=None, cost=None,
+                   max_memory=None, executor=None):
+    """
+    Apply func to every item, sharded across a process pool when workers > 1.
+    Results are returned in the order of items, whatever the number of workers.
+    func must be a picklable top-level function and should handle its own per-item errors.
+    :param func: Function called with a single item
+    :param items: Iterable of picklable items
+    :param workers: Number of worker processes (None or 0 = one per CPU core)
+    :param chunksize: Number of items sent to a worker at once (default: about 4 chunks per worker)
+    :param progress: Optional callback called as progress(done, total) after each item
+    :param on_result: Optional callback called with each result in the calling process as soon as it is
+                      available (e.g. to checkpoint finished items)
+    :param cost: Function giving the estimated memory in bytes an item needs while it is processed
+                 (e.g. memory_budget.estimate_photo_memory), used with max_memory
+    :param max_memory: Optional memory budget in bytes: the number of workers is lowered to fit it and items
+                       are only handed out while the estimated memory of the items in flight stays within it
+    :param executor: Optional process pool with at least workers processes to run on, kept open afterwards
+                     (e.g. by a long-running watcher); by default a pool is started and shut down for this call
+    :return: List of results
+    """
+    items = list(items)
+    workers = min(resolve_workers(workers), len(items))
+    budget = None
+    if max_memory and cost is not None and items:
+        from src.memory_budget import plan_workers
+
+        costs = [cost(item) for item in items]
+        workers, budget = plan_workers(max_memory, workers, max(costs))
+    if workers <= 1:
+        results = (func(item) for item in items)
+        return _collect(results, len(items), progress, on_result)
+
+    own_executor = executor is None
+    if own_executor:
+        from concurrent.futures import ProcessPoolExecutor  # imported on first use: multiprocessing is slow to load
+
+        executor = ProcessPoolExecutor(max_workers=workers)
+    if chunksize is None:
+        chunksize = max(1, len(items) // (workers * 4))
+    try:
+        if budget is not None:
+            results = _map_within_budget(executor, func, items, costs, workers, budget)
+        else:
+            results = executor.map(func, items, chunksize=chunksize)
+        return _collect(results, len(items), progress, on_result)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+def map_photo_tasks(stage, func, tasks, workers=1, max_dimension=None, cache=None, metrics=None, progress=None,
+                    on_result=None, max_memory=None, executor=None):
+    """
+    Run per-photo tasks with map_in_workers within the memory budget, then record their metrics and cache hits.
+    :param stage: Name of the stage in the metrics (e.g. 'crop')
+    :param func: Task function returning a per-file result record ('file', 'ok', 'error', 'cache_hit', 'seconds', ...)
+    :param tasks: Tasks of func; the input path of the photo comes first
+    :param max_dimension: Longest side the photos are decoded at, for their memory estimate (see memory_budget)
+    :param cache: Optional ProcessingCache the tasks use; hits are counted and the cache is trimmed afterwards
+    :param executor: Optional process pool to run on (see map_in_workers)
+    :return: Per-file result records, in the order of tasks
+    """
+    results = map_in_workers(func, tasks, workers, progress=progress, on_result=on_result,
+                             cost=lambda task: estimate_photo_memory(task[0], max_dimension), max_memory=max_memory,
+                             executor=executor)
+    if metrics:
+        metrics.record_results(stage, results)
+    if cache:
+        for result in results:
+            cache.record(result['cache_hit'])
+        cache.trim()
+    return results
+
+def map_photo_folder(stage, func, make_task, input_folder, exts, output_folder, fail_folder=None, output_name=None,
+                     workers=1, max_dimension=None, cache=None, metrics=None, progress=None, dedupe=False,
+                     run_manifest=None, shard=None, max_memory=None):
+    """
+    Run a per-photo task on every photo of a folder, the common part of crop_photos_in_folder,
+    resize_photos_in_folder and process_photos_in_folder: list the photos of the shard, leave out the ones a
+    previous run finished, process byte-identical photos only once, run the tasks (see map_photo_tasks) and
+    copy the outputs to the duplicates (see dedup.fan_out_outputs).
+    :param stage: Name of the stage in the metrics and the run manifest (e.g. 'crop')
+    :param func: Task function returning a per-file result record (see map_photo_tasks)
+    :param make_task: Function giving the task of func for a filename of input_folder
+    :param exts: Extensions of the photos to list
+    :param output_folder: Folder the successful outputs are written to
+    :param fail_folder: Folder the failed outputs are written to (None if failures have no output)
+    :param output_name: Function giving the output filename of an input filename (default: the same name)
+    :param dedupe: Process byte-identical photos (see dedup.split_duplicates) only once and copy the output
+                   to the duplicates
+    :param run_manifest: Optional RunManifest; photos finished by a previous run are skipped and each photo's
+                         outcome is recorded under stage as soon as it is done
+    :param shard: Optional (index, count) tuple from sharding.parse_shard; only the photos of that shard are listed
+    Other parameters as in map_photo_tasks.
+    :return: Tuple (result records sorted by filename, filenames of the shard including the ones skipped)
+    """
+    from src.dedup import split_duplicates, fan_out_outputs  # dedup imports this module
+
+    with measure_stage(metrics, stage):
+        all_filenames = filenames = shard_filenames(list_images(input_folder, exts), shard)
+        on_result = None
+        if run_manifest:
+            filenames = run_manifest.pending(
+                stage, filenames, signature=lambda filename: file_signature(os.path.join(input_folder, filename)))
+            on_result = run_manifest.recorder(stage, input_folder)
+        duplicates = {}
+        if dedupe:
+            filenames, duplicates = split_duplicates(input_folder, filenames)
+        results = map_photo_tasks(stage, func, [make_task(filename) for filename in filenames], workers,
+                                  max_dimension, cache, metrics, progress, on_result, max_memory)
+    if duplicates:
+        results = fan_out_outputs(results, duplicates, output_folder, fail_folder, output_name)
+        print(f"♻️ {len(duplicates)} duplicate photos processed once and copied ({stage}).")
+    return results, all_filenames
+
+def _map_within_budget(executor, func, items, costs, workers, budget):
+    """
+    Submit func(item) one item at a time, with at most workers items in flight whose costs add up to at
+    most budget (a single item over budget runs alone). Yields the results in the order of items.
+    """
+    from concurrent.futures import wait, FIRST_COMPLETED
+
+    ordered = deque()
+    in_flight = {}  # future -> cost
+    for item, item_cost in zip(items, costs):
+        while in_flight and (len(in_flight) >= workers or sum(in_flight.values()) + item_cost > budget):
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                del in_flight[future]
+            while ordered and ordered[0].done():
+                yield ordered.popleft().result()
+        future = executor.submit(func, item)
+        in_flight[future] = item_cost
+        ordered.append(future)
+    for future in ordered:
+        yield future.result()
+
+def _collect(results, total, progress, on_result=None):
+    """
+    Gather results into a list, reporting progress(done, total) and calling on_result(result) if given.
+    """
+    if progress is None and on_result is None:
+        return list(results)
+    collected = []
+    if progress is not None:
+        progress(0, total)
+    for result in results:
+        collected.append(result)
+        if on_result is not None:
+            on_result(result)
+        if progress is not None:
+            progress(len(collected), total)
+    return collected
+
+def list_images(folder, exts):
+    """
+    List the image filenames in folder with one of the given extensions, sorted for deterministic output.
+    """
+    return sorted(filename for filename in os.listdir(folder) if filename.lower().endswith(exts))
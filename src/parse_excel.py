@@ -1,5 +1,3 @@
-import pandas as pd
-
 def load_excel(file_path, sheet_name="Sheet1"):
     """
     Load an Excel file and return a DataFrame.
@@ -7,6 +5,8 @@ def load_excel(file_path, sheet_name="Sheet1"):
     :param sheet_name: Name of the sheet to load.
     :return: DataFrame containing the data from the specified sheet.
     """
+    import pandas as pd  # imported on first use, so tools that never read a report start fast
+
     try:
         df = pd.read_excel(file_path, sheet_name=sheet_name)
         return df
@@ -14,25 +14,107 @@ def load_excel(file_path, sheet_name="Sheet1"):
         print(f"Error loading Excel file: {e}")
         return None
     
+def load_report(file_path, sheet_name="Sheet1", columns=None):
+    """
+    Load a report from an Excel (.xlsx/.xlsm), CSV or Parquet file and return a DataFrame.
+    :param file_path: Path (or uploaded file object with a name) of the report.
+    :param sheet_name: Name of the sheet to load (Excel only).
+    :param columns: Only load these columns (optional).
+    :return: DataFrame containing the report, or None if it cannot be loaded.
+    """
+    import pandas as pd  # imported on first use, so tools that never read a report start fast
+
+    try:
+        file_format = _report_format(file_path)
+        if file_format == "csv":
+            return pd.read_csv(file_path, usecols=columns)
+        if file_format == "parquet":
+            return pd.read_parquet(file_path, columns=columns)
+        return pd.read_excel(file_path, sheet_name=sheet_name, usecols=columns)
+    except Exception as e:
+        print(f"Error loading report file: {e}")
+        return None
+
+def _report_format(file_path):
+    name = str(getattr(file_path, "name", file_path)).lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".parquet", ".pq")):
+        return "parquet"
+    return "excel"
+
 def extract_profile_data(df, id_col="Confirmation_Number", url_col="Image_URL", photoname_col="Photo_Name"):
     """
     Extract profile data from the DataFrame.
+    Works column by column instead of building a Series per row, so it stays fast on large reports.
     :param df: DataFrame containing the profile data.
     :param id_col: Column name for the ID.
     :param url_col: Column name for the image URL.
-    :param name_col: Column name for the profile name.
+    :param photoname_col: Column name for the photo name.
     :return: List of dictionaries with profile data.
     """
-    profiles = []
-    for index, row in df.iterrows():
+    try:
+        ids, urls, photonames = (df[col].tolist() for col in (id_col, url_col, photoname_col))
+    except KeyError as e:
+        print(f"Skipping all rows: column {e} not found")
+        return []
+    return [
+        {"id": id, "url": url, "photoname": photoname}
+        for id, url, photoname in zip(ids, urls, photonames)
+    ]
+
+def iter_profile_batches(file_path, sheet_name="Sheet1", batch_size=1000,
+                         id_col="Confirmation_Number", url_col="Image_URL", photoname_col="Photo_Name"):
+    """
+    Stream profile data from a report in batches, without loading the whole report in memory.
+    Excel files are read with openpyxl in read-only mode, CSV files in chunks and Parquet files
+    by record batch (requires pyarrow), always reading only the three profile columns.
+    :param file_path: Path (or uploaded file object with a name) of the report.
+    :param sheet_name: Name of the sheet to read (Excel only).
+    :param batch_size: Number of profiles per batch.
+    :return: Generator of lists of dictionaries with profile data, like extract_profile_data.
+    """
+    columns = [id_col, url_col, photoname_col]
+    file_format = _report_format(file_path)
+
+    if file_format == "csv":
+        import pandas as pd
+
+        for chunk in pd.read_csv(file_path, usecols=columns, chunksize=batch_size):
+            yield extract_profile_data(chunk, id_col, url_col, photoname_col)
+
+    elif file_format == "parquet":
+        import pyarrow.parquet as pq  # optional dependency, only needed for Parquet reports
+
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=batch_size, columns=columns):
+            data = batch.to_pydict()
+            yield [
+                {"id": id, "url": url, "photoname": photoname}
+                for id, url, photoname in zip(data[id_col], data[url_col], data[photoname_col])
+            ]
+
+    else:
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
         try:
-            profile = {
-                "id": row[id_col],
-                "url": row[url_col],
-                "photoname": row[photoname_col]
-            }
-            profiles.append(profile)
-        except Exception as e:
-            print(f"Skipping row {index} due to error: {e}")
-            continue
-    return profiles
\ No newline at end of file
+            rows = workbook[sheet_name].iter_rows(values_only=True)
+            header = list(next(rows, ()))
+            try:
+                positions = [header.index(col) for col in columns]
+            except ValueError:
+                print(f"Skipping all rows: columns {columns} not all found in sheet {sheet_name}")
+                return
+            batch = []
+            for row in rows:
+                if row is None or all(value is None for value in row):
+                    continue  # blank rows (pd.read_excel skips them too)
+                id, url, photoname = (row[i] if i < len(row) else None for i in positions)
+                batch.append({"id": id, "url": url, "photoname": photoname})
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        finally:
+            workbook.close()
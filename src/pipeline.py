@@ -0,0 +1,212 @@
+import io
+import os
+import time
+from src.image_io import load_image
+from src.cropper import crop_image, SUPPORTED_EXTS
+from src.face_detect import detect_faces_cached, face_center, resolve_crop_mode
+from src.size_adjuster import encode_image, fit_to_size, check_output_format, output_filename
+from src.validator import build_validation_record
+from src.parallel import map_photo_tasks, map_photo_folder
+from src.dedup import add_duplicate_groups, find_duplicate_groups
+from src.file_utils import atomic_write_bytes
+
+def process_image(data, photoname, target_ratio=0.75, min_kb=50, max_kb=1024, max_dimension=None, crop_mode="center",
+                  cache=None, output_format="jpeg", quality=False, subsampling=None):
+    """
+    Crop, resize and validate one photo in memory, decoding it only once.
+    Equivalent to running crop_photos_in_folder, resize_photos_in_folder and
+    validate_photos_in_folder on a single file, without the intermediate JPEG round trips.
+    :param data: Encoded image bytes (JPEG or PNG)
+    :param photoname: Name used for the validation record
+    :param target_ratio: Aspect ratio to crop to (e.g. 0.75 = 3:4)
+    :param min_kb: Minimum output size in KB
+    :param max_kb: Maximum output size in KB
+    :param max_dimension: Longest side in pixels of the photo before cropping; JPEGs are decoded
+                          directly at reduced resolution when this allows (None keeps full resolution)
+    :param crop_mode: "center" for a center crop, "face" to center the crop on the largest face (needs OpenCV)
+    :param cache: Optional ProcessingCache used for the face detections
+    :param output_format: Encoder of the output, one of size_adjuster.OUTPUT_FORMATS (default: baseline JPEG)
+    :param quality: Add the quality columns of quality.quality_metrics to the validation record, with ssim and psnr
+                    of the output against the crop it was encoded from
+    :param subsampling: Chroma subsampling of JPEG outputs, one of size_adjuster.SUBSAMPLING_MODES
+                        (default: the format's)
+    :return: Dictionary with 'photoname', 'ok', 'data' (encoded bytes), 'error', 'validation' and 'encodes'.
+             When ok is False, data holds the photo at default quality and validation is None.
+    """
+    img = load_image(io.BytesIO(data), max_dimension)
+    center = face_center(detect_faces_cached(data, img, cache)) if crop_mode == 'face' else None
+    img = crop_image(img, target_ratio, center)
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+
+    # The crop stage used to save at default quality; if that already fits, it is the final output
+    output = encode_image(img, output_format=output_format, subsampling=subsampling)
+    dimensions = img.size
+    encodes = 1
+    error = None
+    if not min_kb <= len(output) / 1024 <= max_kb:
+        fit = fit_to_size(img, min_kb, max_kb, output_format=output_format, subsampling=subsampling)
+        encodes += fit['encodes']
+        error = fit['error']
+        if fit['data'] is not None:
+            output, dimensions = fit['data'], fit['dimensions']
+
+    result = {
+        'photoname': photoname,
+        'ok': error is None,
+        'data': output,
+        'error': error,
+        'validation': None,
+        'encodes': encodes,
+    }
+    if error is None:
+        result['validation'] = build_validation_record(photoname, len(output), *dimensions)
+        if quality:
+            from src.quality import quality_metrics, QUALITY_DIMENSION  # imported on first use: numpy is slow to load
+
+            result['validation'].update(quality_metrics(load_image(io.BytesIO(output), QUALITY_DIMENSION), img))
+    return result
+
+def process_photo_file(input_path, output_folder, fail_subfolder, target_ratio=0.75, min_kb=50, max_kb=1024,
+                       max_dimension=None, cache=None, crop_mode="center", output_format="jpeg", quality=False,
+                       subsampling=None):
+    """
+    Run process_image on one file and write the output to output_folder (or fail_subfolder).
+    If a ProcessingCache is given, the result is served from / stored in it.
+    Returns the result of process_image without the encoded bytes, plus 'cache_hit', 'bytes_in' and 'bytes_out'.
+    """
+    filename = os.path.basename(input_path)
+    photoname = os.path.splitext(filename)[0]
+    with open(input_path, 'rb') as f:
+        data = f.read()
+
+    crop_mode = resolve_crop_mode(crop_mode)
+    key = cache.make_key(data, 'process', target_ratio, min_kb, max_kb, max_dimension, crop_mode,
+                         output_format, quality, subsampling) if cache else None
+    entry = cache.get(key) if cache else None
+    if entry is not None:
+        result, output = entry[0], entry[1]
+        result['photoname'] = photoname
+        if result['validation'] is not None:
+            result['validation']['Photo_Name'] = photoname  # same photo may be cached under another name
+        result['encodes'] = 0
+    else:
+        result = process_image(data, photoname, target_ratio, min_kb, max_kb, max_dimension, crop_mode, cache,
+                               output_format, quality, subsampling)
+        output = result.pop('data')
+        if cache:
+            cache.put(key, output, result)
+
+    output_path = os.path.join(output_folder if result['ok'] else fail_subfolder, output_filename(filename, output_format))
+    atomic_write_bytes(output_path, output)
+    result.update(cache_hit=entry is not None, bytes_in=len(data), bytes_out=len(output))
+    return result
+
+def _process_task(task):
+    """
+    Process one file for process_photos_in_folder. Returns the result of process_photo_file
+    plus 'file' and 'seconds'.
+    """
+    input_path = task[0]
+    start = time.perf_counter()
+    try:
+        result = process_photo_file(*task)
+    except Exception as e:
+        result = {'ok': False, 'error': f"Error during processing — {e}", 'validation': None, 'cache_hit': False}
+    result['file'] = os.path.basename(input_path)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def _with_finished_results(results, filenames, run_manifest):
+    """
+    Add result records rebuilt from the run manifest for the photos a previous run already processed,
+    so a resumed run still reports every photo. Returns all records sorted by filename.
+    """
+    processed = {result['file'] for result in results}
+    finished = []
+    for filename in filenames:
+        entry = run_manifest.get('process', filename)
+        if filename not in processed and entry is not None:
+            finished.append({'file': filename, 'ok': entry['state'] == 'done', 'error': entry['error'],
+                             'validation': entry.get('validation')})
+    return sorted(results + finished, key=lambda result: result['file'])
+
+def process_photo_files(paths, output_folder, target_ratio=0.75, min_kb=50, max_kb=1024, workers=1,
+                        max_dimension=None, cache=None, metrics=None, progress=None, crop_mode="center",
+                        on_result=None, output_format="jpeg", max_memory=None, quality=False, subsampling=None,
+                        executor=None):
+    """
+    Run the fused crop → resize → validate pipeline on a list of photo files, e.g. the new files of a watched folder.
+    Outputs are written to output_folder, photos that cannot be resized go to output_folder/failed.
+    Takes the same options as process_photos_in_folder, plus on_result and executor (see parallel.map_in_workers).
+    :return: Per-file result records (see _process_task), in the order of paths
+    """
+    fail_subfolder = os.path.join(output_folder, "failed")
+    os.makedirs(fail_subfolder, exist_ok=True)
+    tasks = [
+        (path, output_folder, fail_subfolder, target_ratio, min_kb, max_kb, max_dimension, cache, crop_mode,
+         output_format, quality, subsampling)
+        for path in paths
+    ]
+    return map_photo_tasks('process', _process_task, tasks, workers, max_dimension, cache, metrics, progress,
+                           on_result, max_memory, executor)
+
+def process_photos_in_folder(input_folder, output_folder, target_ratio=0.75, min_kb=50, max_kb=1024, workers=1,
+                             max_dimension=None, cache=None, metrics=None, progress=None, crop_mode="center",
+                             dedupe=False, run_manifest=None, output_format="jpeg", shard=None, max_memory=None,
+                             quality=False, subsampling=None):
+    """
+    Run the fused crop → resize → validate pipeline on every image in input_folder.
+    Outputs are written to output_folder, photos that cannot be resized go to output_folder/failed.
+    :param max_dimension: Longest side in pixels of the photos before cropping (None keeps full resolution)
+    :param workers: Number of worker processes (None or 0 = one per CPU core)
+    :param cache: Optional ProcessingCache; unchanged photos are then copied from it instead of re-processed
+    :param metrics: Optional RunMetrics recording per-file timings under the 'process' stage
+    :param progress: Optional callback called as progress(done, total) after each photo
+    :param crop_mode: "center" for center crops, "face" to center the crops on the largest face (needs OpenCV)
+    :param dedupe: Process byte-identical photos (see dedup.split_duplicates) only once and copy the output
+                   to the duplicates; the validation records then get a 'duplicate_group' column naming
+                   near-duplicate photos (see dedup.find_duplicate_groups), which are still processed separately
+    :param run_manifest: Optional RunManifest; photos finished by a previous run are skipped (their validation
+                     records are taken from the run manifest) and each photo's outcome is recorded under the
+                     'process' stage as soon as it is processed
+    :param output_format: Encoder of the output photos, one of size_adjuster.OUTPUT_FORMATS: 'jpeg' (baseline,
+                          default), 'progressive_jpeg', 'webp' or 'avif'. Non-JPEG outputs get the format's extension
+    :param shard: Optional (index, count) tuple from sharding.parse_shard; only the photos of that shard are processed
+    :param max_memory: Optional memory budget in bytes; workers and photos in flight are limited to stay within
+                       it, by the estimated decoded size of each photo (see memory_budget)
+    :param quality: Add the quality columns of quality.quality_metrics to the validation records: sharpness,
+                    exposure, ssim and psnr of each output against its crop, and a quality_issue for blurry,
+                    over/underexposed or near-blank photos
+    :param subsampling: Chroma subsampling of JPEG outputs, one of size_adjuster.SUBSAMPLING_MODES
+                        (default: the format's)
+    :return: Tuple (validation records for the photos written to output_folder,
+             error records ({'file', 'stage', 'error'}) for the others)
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    fail_subfolder = os.path.join(output_folder, "failed")
+    os.makedirs(fail_subfolder, exist_ok=True)
+
+    crop_mode = resolve_crop_mode(crop_mode)
+    check_output_format(output_format, subsampling)
+    results, all_filenames = map_photo_folder(
+        'process', _process_task,
+        lambda filename: (os.path.join(input_folder, filename), output_folder, fail_subfolder, target_ratio, min_kb,
+                          max_kb, max_dimension, cache, crop_mode, output_format, quality, subsampling),
+        input_folder, SUPPORTED_EXTS, output_folder, fail_subfolder,
+        output_name=lambda filename: output_filename(filename, output_format), workers=workers,
+        max_dimension=max_dimension, cache=cache, metrics=metrics, progress=progress, dedupe=dedupe,
+        run_manifest=run_manifest, shard=shard, max_memory=max_memory,
+    )
+    if run_manifest and len(results) < len(all_filenames):
+        results = _with_finished_results(results, all_filenames, run_manifest)
+
+    result_dict_list = [result['validation'] for result in results if result['validation'] is not None]
+    if dedupe:
+        add_duplicate_groups(result_dict_list, find_duplicate_groups(input_folder, all_filenames, workers=workers))
+    if quality:
+        from src.quality import print_quality_summary  # imported on first use: numpy is slow to load
+
+        print_quality_summary(result_dict_list)
+    errors = [{'file': result['file'], 'stage': 'process', 'error': result['error']} for result in results if not result['ok']]
+    return result_dict_list, errors
@@ -0,0 +1,156 @@
+import os
+import numpy as np
+from PIL import Image
+from src.image_io import load_image
+from src.cropper import crop_to_aspect_ratio
+
+# Longest side of the grayscale copy the metrics are computed on: keeps the cost per photo low
+# (JPEGs are decoded directly at reduced resolution) while blur and exposure problems stay visible
+QUALITY_DIMENSION = 256
+# Side of the square window of the local SSIM statistics
+SSIM_WINDOW = 7
+# Thresholds of the quality checks, on the QUALITY_DIMENSION copy with 0-255 gray levels
+BLUR_THRESHOLD = 60           # Laplacian variance below this: blurry
+BLANK_CONTRAST = 8            # standard deviation of the gray levels below this: near blank
+OVEREXPOSED_BRIGHTNESS = 235  # mean gray level above this: overexposed
+UNDEREXPOSED_BRIGHTNESS = 35  # mean gray level below this: underexposed
+# More than this fraction of pixels clipped to white (or black): over/underexposed. Profile photos
+# often have a white background, which is clipped but fine
+CLIPPED_FRACTION = 0.75
+QUALITY_FIELDS = ('sharpness', 'brightness', 'contrast', 'highlights_clipped', 'shadows_clipped', 'ssim', 'psnr',
+                  'quality_issue')
+
+def grayscale_array(img, size=None):
+    """
+    Downscaled grayscale copy of an image as a float64 array.
+    :param size: (width, height) to resize to (default: longest side at most QUALITY_DIMENSION)
+    """
+    if size is None:
+        scale = min(1.0, QUALITY_DIMENSION / max(img.size))
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    if img.size != size:
+        img = img.resize(size, Image.BILINEAR, reducing_gap=2.0)
+    return np.asarray(img.convert('L'), dtype=np.float64)
+
+def sharpness(gray):
+    """
+    Variance of the Laplacian (4-neighbour kernel) of a grayscale array: low for blurry photos.
+    """
+    if min(gray.shape) < 3:
+        return 0.0
+    laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]) - 4 * gray[1:-1, 1:-1]
+    return float(laplacian.var())
+
+def exposure_stats(gray):
+    """
+    Exposure statistics of a grayscale array: mean gray level ('brightness'), standard deviation
+    ('contrast') and the fractions of pixels clipped to white ('highlights_clipped', >= 250) and
+    to black ('shadows_clipped', <= 5), from its 256-bin histogram.
+    """
+    histogram = np.bincount(gray.astype(np.uint8).ravel(), minlength=256) / gray.size
+    levels = np.arange(256)
+    brightness = float(histogram @ levels)
+    return {
+        'brightness': brightness,
+        'contrast': float(np.sqrt(histogram @ (levels - brightness) ** 2)),
+        'highlights_clipped': float(histogram[250:].sum()),
+        'shadows_clipped': float(histogram[:6].sum()),
+    }
+
+def psnr(reference, gray):
+    """
+    Peak signal-to-noise ratio in dB of a grayscale array against a reference of the same shape
+    (None if they are identical).
+    """
+    mse = float(np.mean((reference - gray) ** 2))
+    return None if mse == 0 else float(10 * np.log10(255 ** 2 / mse))
+
+def _box_mean(values, size):
+    """
+    Mean over every size x size window of a 2D array (valid windows only), from its integral image.
+    """
+    integral = np.pad(values, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+    sums = integral[size:, size:] - integral[:-size, size:] - integral[size:, :-size] + integral[:-size, :-size]
+    return sums / (size * size)
+
+def ssim(reference, gray, window=SSIM_WINDOW):
+    """
+    Mean structural similarity of a grayscale array against a reference of the same shape,
+    with uniform window x window local statistics: 1.0 for identical images.
+    """
+    window = min(window, *reference.shape)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    mean_ref, mean_gray = _box_mean(reference, window), _box_mean(gray, window)
+    var_ref = _box_mean(reference * reference, window) - mean_ref ** 2
+    var_gray = _box_mean(gray * gray, window) - mean_gray ** 2
+    covariance = _box_mean(reference * gray, window) - mean_ref * mean_gray
+    similarity = ((2 * mean_ref * mean_gray + c1) * (2 * covariance + c2)) / (
+        (mean_ref ** 2 + mean_gray ** 2 + c1) * (var_ref + var_gray + c2))
+    return float(similarity.mean())
+
+def quality_issue(record):
+    """
+    Reason a photo is rejected on quality ('near blank', 'overexposed', 'underexposed' or 'blurry'),
+    or None if it passes, from the metrics of quality_metrics. Exposure is checked before sharpness:
+    the Laplacian variance also drops when a photo is too dark or too bright.
+    """
+    if record['contrast'] < BLANK_CONTRAST:
+        return 'near blank'
+    if record['brightness'] > OVEREXPOSED_BRIGHTNESS or record['highlights_clipped'] > CLIPPED_FRACTION:
+        return 'overexposed'
+    if record['brightness'] < UNDEREXPOSED_BRIGHTNESS or record['shadows_clipped'] > CLIPPED_FRACTION:
+        return 'underexposed'
+    if record['sharpness'] < BLUR_THRESHOLD:
+        return 'blurry'
+    return None
+
+def quality_metrics(img, source=None):
+    """
+    Quality metrics of a photo, computed on a downscaled grayscale copy: 'sharpness' (see sharpness),
+    exposure statistics (see exposure_stats), 'ssim' and 'psnr' against the source photo, and
+    'quality_issue' (see quality_issue).
+    :param img: Decoded photo
+    :param source: Optional decoded photo img was made from (e.g. the crop before resizing); it is center-cropped
+                   to the aspect ratio of img if needed. Without it, ssim and psnr are None
+    :return: Dictionary with the QUALITY_FIELDS columns
+    """
+    gray = grayscale_array(img)
+    record = {'sharpness': sharpness(gray), **exposure_stats(gray), 'ssim': None, 'psnr': None}
+    if source is not None:
+        if abs(source.width / source.height - img.width / img.height) > 0.01:
+            source = crop_to_aspect_ratio(source, img.width / img.height)
+        reference = grayscale_array(source, size=(gray.shape[1], gray.shape[0]))
+        record.update(ssim=ssim(reference, gray), psnr=psnr(reference, gray))
+    record['quality_issue'] = quality_issue(record)
+    return {field: round(value, 4) if isinstance(value, float) else value for field, value in record.items()}
+
+def quality_task(task):
+    """
+    Compute the quality metrics of one photo file for validate_photos_in_folder.
+    :param task: Tuple (photo path, path of its source photo or None)
+    :return: Tuple (photo name, quality columns); the columns are None except 'quality_issue' if a photo cannot be read
+    """
+    path, source_path = task
+    photoname = os.path.splitext(os.path.basename(path))[0]
+    try:
+        img = load_image(path, QUALITY_DIMENSION)
+        source = None
+        if source_path is not None and os.path.exists(source_path):
+            # Larger than the photo, so a crop of the source still covers QUALITY_DIMENSION pixels
+            source = load_image(source_path, 2 * QUALITY_DIMENSION)
+        return photoname, quality_metrics(img, source)
+    except Exception as e:
+        return photoname, dict(dict.fromkeys(QUALITY_FIELDS), quality_issue=f"unreadable: {e}")
+
+def print_quality_summary(records):
+    """
+    Print how many photos of a list of validation records were flagged by the quality checks, per issue.
+    """
+    issues = {}
+    for record in records:
+        if record.get('quality_issue'):
+            issue = record['quality_issue'].split(':')[0]
+            issues[issue] = issues.get(issue, 0) + 1
+    if issues:
+        details = ', '.join(f"{count} {issue}" for issue, count in sorted(issues.items()))
+        print(f"⚠️ {sum(issues.values())} photos flagged by the quality checks: {details}.")
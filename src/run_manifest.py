@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+import time
+from src.file_utils import atomic_open
+
+class RunManifest:
+    """
+    Append-only JSON Lines log of the state of every item (photo) per stage of a run, written as each
+    item finishes, so an interrupted run can be resumed where it stopped. The file is never truncated:
+    every run starts with a header line ('run', 'time', 'resume', 'retry_failed'), followed by one line per
+    item with 'stage', 'item', 'state' ('done' or 'failed'), 'error' (the failure reason), 'signature'
+    (the input the item was processed from: URL, or size and modification time of the file) and 'time'.
+    The latest line of an item wins, whichever run wrote it. A line cut short by a crash is ignored.
+    When a run opens the manifest, the file is compacted to the latest line of every item (without the
+    run headers), so it does not keep growing with every run.
+    :param path: Path of the manifest file
+    :param resume: Keep the states of the previous runs: finished items are skipped, the others run again
+    :param retry_failed: Like resume, but items that failed in a previous run are run again too
+    """
+    def __init__(self, path, resume=False, retry_failed=False):
+        self.path = str(path)
+        self.retry_failed = retry_failed
+        self.entries = {}
+        self.skipped_failures = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        entries, lines = self._load()
+        if lines > len(entries):
+            self._compact(entries)
+        if resume or retry_failed:
+            self.entries = entries
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if self._file.tell() and not self._ends_with_newline():
+            self._file.write('\n')  # the last line was cut short by a crash, start on a new one
+        header = {'run': 'start', 'time': time.time(), 'resume': bool(resume), 'retry_failed': bool(retry_failed)}
+        self._file.write(json.dumps(header) + '\n')
+        self._file.flush()
+
+    def _load(self):
+        """
+        Read the manifest. Returns a tuple ({(stage, item): latest entry}, number of lines).
+        """
+        entries = {}
+        lines = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if 'stage' not in entry:
+                        continue  # run header
+                    entries[(entry['stage'], entry['item'])] = entry
+        except OSError:
+            pass
+        return entries, lines
+
+    def _compact(self, entries):
+        """
+        Rewrite the manifest with only the given entries, replacing the file atomically.
+        """
+        with atomic_open(self.path, 'w') as f:
+            for entry in entries.values():
+                f.write(json.dumps(entry) + '\n')
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def is_pending(self, stage, item, signature=None):
+        """
+        Whether an item still has to run in a stage: it never finished, its input changed (other signature),
+        or it failed and failed items are retried. Failed items that are not retried are listed in
+        skipped_failures[stage], so the run can still report them.
+        """
+        entry = self.entries.get((stage, str(item)))
+        if entry is None or entry.get('signature') != signature:
+            return True
+        if entry['state'] == 'failed':
+            if not self.retry_failed:
+                self.skipped_failures.setdefault(stage, []).append(entry['item'])
+            return self.retry_failed
+        return entry['state'] != 'done'
+
+    def pending(self, stage, items, name=os.path.basename, signature=None):
+        """
+        Keep the items of a stage that still have to run (see is_pending), printing how many are skipped.
+        Lists are filtered right away; other iterables (e.g. streamed report rows) are filtered lazily.
+        :param items: Items of the stage (e.g. file paths or profiles)
+        :param name: Function giving the manifest item name of an item (default: the file name of a path)
+        :param signature: Function giving the signature of an item (default: none)
+        """
+        keep = (item for item in items
+                if self.is_pending(stage, name(item), signature(item) if signature else None))
+        if not isinstance(items, list):
+            return keep
+        kept = list(keep)
+        if len(kept) < len(items):
+            print(f"⏭️ Skipping {len(items) - len(kept)} photos finished by a previous run ({stage}).")
+        return kept
+
+    def record(self, stage, item, ok, error=None, signature=None, **extra):
+        """
+        Append the outcome of an item in a stage. Extra keyword arguments are stored with the entry.
+        """
+        entry = {
+            'stage': stage,
+            'item': str(item),
+            'state': 'done' if ok else 'failed',
+            'error': error,
+            'signature': signature,
+            'time': time.time(),
+            **extra,
+        }
+        with self._lock:
+            self.entries[(stage, entry['item'])] = entry
+            self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()  # on disk even if the process dies right after
+
+    def recorder(self, stage, folder):
+        """
+        Return an on_result callback for map_in_workers that records the per-file result records
+        ('file', 'ok', 'error') of a stage, signed with the input file in folder as it is now.
+        """
+        def record_result(result):
+            self.record(stage, result['file'], result['ok'], result['error'],
+                        file_signature(os.path.join(folder, result['file'])),
+                        validation=result.get('validation'))
+        return record_result
+
+    def get(self, stage, item):
+        """
+        Last entry recorded for an item in a stage, or None.
+        """
+        return self.entries.get((stage, str(item)))
+
+    def counts(self, stage):
+        """
+        Number of items per state in a stage, e.g. {'done': 10, 'failed': 2}.
+        """
+        counts = {}
+        for (entry_stage, _), entry in self.entries.items():
+            if entry_stage == stage:
+                counts[entry['state']] = counts.get(entry['state'], 0) + 1
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+def file_signature(path):
+    """
+    Signature of an input file for RunManifest: [size, modification time in ns], or None if it does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
@@ -0,0 +1,116 @@
+import csv
+import glob
+import hashlib
+import os
+import re
+
+def parse_shard(spec):
+    """
+    Parse a shard specification "i/N" (1 <= i <= N) into an (index, count) tuple.
+    Raises ValueError for malformed specifications.
+    """
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', str(spec))
+    if not match:
+        raise ValueError(f"Invalid shard '{spec}', expected i/N (e.g. 1/4)")
+    index, count = int(match.group(1)), int(match.group(2))
+    if not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{spec}', i must be between 1 and N")
+    return index, count
+
+def shard_of(photoname, count):
+    """
+    Shard (1..count) a photo belongs to, from a stable hash of its photo name, so every node and every
+    stage assigns a photo to the same shard whatever the order or content of its input.
+    """
+    digest = hashlib.blake2b(str(photoname).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % count + 1
+
+def in_shard(photoname, shard):
+    """
+    Whether a photo name belongs to a shard ((index, count) tuple); always True if shard is None.
+    """
+    return shard is None or shard_of(photoname, shard[1]) == shard[0]
+
+def shard_filenames(filenames, shard):
+    """
+    Keep the filenames of a folder listing that belong to a shard, by photo name (filename without extension),
+    so the same photo stays in the same shard through download, crop, resize and format changes.
+    """
+    if shard is None:
+        return filenames
+    return [filename for filename in filenames if in_shard(os.path.splitext(filename)[0], shard)]
+
+def shard_profiles(profiles, shard):
+    """
+    Keep the profiles (dictionaries with a 'photoname') that belong to a shard.
+    Lists are filtered right away, other iterables (e.g. streamed report batches) lazily.
+    """
+    if shard is None:
+        return profiles
+    keep = (profile for profile in profiles if in_shard(profile['photoname'], shard))
+    return list(keep) if isinstance(profiles, list) else keep
+
+def shard_path(path, shard):
+    """
+    Per-shard variant of an output path: report.xlsx becomes report.shard-2-of-4.xlsx.
+    Returns path unchanged if shard is None.
+    """
+    if shard is None:
+        return path
+    root, ext = os.path.splitext(str(path))
+    return f"{root}.shard-{shard[0]}-of-{shard[1]}{ext}"
+
+def find_partial_reports(output_path):
+    """
+    Find the partial reports written for output_path by sharded runs.
+    :return: Tuple (shard count, {shard index: path}); count is None if no partial report exists
+    :raises ValueError: if partial reports of different shard counts are found
+    """
+    root, ext = os.path.splitext(str(output_path))
+    pattern = re.compile(re.escape(os.path.basename(root)) + r'\.shard-(\d+)-of-(\d+)' + re.escape(ext) + '$')
+    partials, counts = {}, set()
+    for path in glob.glob(f"{glob.escape(root)}.shard-*-of-*{glob.escape(ext)}"):
+        match = pattern.match(os.path.basename(path))
+        if match:
+            partials[int(match.group(1))] = path
+            counts.add(int(match.group(2)))
+    if len(counts) > 1:
+        raise ValueError(f"Partial reports for {output_path} come from runs with different shard counts: "
+                         f"{sorted(counts)}, remove the stale ones")
+    return (counts.pop() if counts else None), partials
+
+def merge_partial_reports(output_path):
+    """
+    Combine the partial validation reports of all shards (see shard_path) into output_path, like
+    save_validation_results would have written it from a single run. Rows are kept in shard order.
+    CSV reports are merged with the csv module, Excel reports with pandas.
+    :return: True if the report was written, False if partial reports are missing
+    """
+    from src.validator import save_validation_results
+
+    count, partials = find_partial_reports(output_path)
+    if count is None:
+        print(f"❌ No partial reports found for {output_path}.")
+        return False
+    missing = [index for index in range(1, count + 1) if index not in partials]
+    if missing:
+        print(f"❌ Missing partial reports for shards {', '.join(f'{index}/{count}' for index in missing)} "
+              f"of {output_path}, not merging.")
+        return False
+
+    paths = [partials[index] for index in range(1, count + 1)]
+    if str(output_path).lower().endswith('.csv'):
+        rows = []
+        for path in paths:
+            with open(path, newline='', encoding='utf-8') as f:
+                rows.extend(csv.DictReader(f))
+        save_validation_results(rows, output_path)
+    else:
+        import pandas as pd  # imported on first use, only Excel reports need it
+
+        df = pd.concat([pd.read_excel(path) for path in paths], ignore_index=True)
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        df.to_excel(output_path, index=False)
+        print(f"✅ Validation results saved to {output_path}")
+    print(f"🧩 Merged {count} partial reports.")
+    return True
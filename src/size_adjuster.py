@@ -1,76 +1,318 @@
 import os
 import io
-from PIL import Image, ImageOps
+import time
+from PIL import Image, features
+from src.image_io import load_image
+from src.parallel import map_photo_folder
+from src.file_utils import atomic_write_bytes
 
-def resize_photo(img, output_path, min_kb=50, max_kb=1024):
+SUPPORTED_EXTS = ('.jpg', '.jpeg', '.png')
+
+# Typical JPEG bits per pixel by quality for photos (median over the demo set), used to seed the search
+QUALITY_BPP_MODEL = (
+    (100, 2.30), (95, 1.13), (90, 0.84), (85, 0.70), (80, 0.66), (70, 0.55),
+    (60, 0.44), (50, 0.40), (40, 0.34), (30, 0.30), (20, 0.24), (10, 0.18),
+)
+MIN_QUALITY = 30        # below this, downscaling looks better than more JPEG artefacts
+ACCEPT_FRACTION = 0.9   # stop searching once the photo uses at least 90% of max_kb
+MAX_DOWNSCALES = 3
+# Chroma subsamplings that can be chosen for JPEG outputs, sharpest colours first
+SUBSAMPLING_MODES = ('4:4:4', '4:2:2', '4:2:0')
+
+# Output encoders: Pillow format, file extension, encoder settings, and typical bits per pixel by quality
+# (median over the cropped demo set) seeding the quality search of each format.
+# 'jpeg' keeps Pillow's default baseline settings; 'progressive_jpeg' adds Huffman table optimization and
+# progressive scans with 4:2:0 chroma subsampling by default (see the subsampling argument of encode_image).
+OUTPUT_FORMATS = {
+    'jpeg': {'format': 'JPEG', 'ext': '.jpg', 'options': {}, 'model': QUALITY_BPP_MODEL},
+    'progressive_jpeg': {
+        'format': 'JPEG', 'ext': '.jpg',
+        'options': {'optimize': True, 'progressive': True, 'subsampling': '4:2:0'},
+        'model': ((100, 2.46), (95, 1.39), (90, 1.03), (85, 0.88), (80, 0.79), (70, 0.64),
+                  (60, 0.50), (50, 0.45), (40, 0.38), (30, 0.31), (20, 0.23), (10, 0.15)),
+    },
+    'webp': {
+        'format': 'WEBP', 'ext': '.webp', 'options': {'method': 4},
+        'model': ((100, 1.67), (95, 1.20), (90, 0.81), (85, 0.60), (80, 0.46), (70, 0.34),
+                  (60, 0.30), (50, 0.26), (40, 0.22), (30, 0.18), (20, 0.15), (10, 0.12)),
+    },
+    'avif': {
+        'format': 'AVIF', 'ext': '.avif', 'options': {'speed': 8},  # fastest speed that keeps the quality
+        'model': ((100, 3.25), (95, 1.34), (90, 1.00), (85, 0.82), (80, 0.74), (70, 0.58),
+                  (60, 0.45), (50, 0.31), (40, 0.20), (30, 0.13), (20, 0.09), (10, 0.07)),
+    },
+}
+
+def check_output_format(output_format, subsampling=None):
     """
-    Adjust the size of a photo to fall within the specified size range.
-    Returns True if adjustment was successful, False otherwise.
+    Check that an output format is known and supported by the installed Pillow build (WebP and AVIF
+    need Pillow built with libwebp / libavif), and that a chroma subsampling, if given, is one of
+    SUBSAMPLING_MODES for a JPEG format. Raises ValueError otherwise.
     """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', expected one of {', '.join(OUTPUT_FORMATS)}")
+    codec = OUTPUT_FORMATS[output_format]['format'].lower()
+    if codec != 'jpeg' and not features.check(codec):
+        raise ValueError(f"This Pillow build cannot encode {codec.upper()} (output format '{output_format}')")
+    if subsampling is not None:
+        if subsampling not in SUBSAMPLING_MODES:
+            raise ValueError(f"Unknown chroma subsampling '{subsampling}', expected one of "
+                             f"{', '.join(SUBSAMPLING_MODES)}")
+        if codec != 'jpeg':
+            raise ValueError(f"Chroma subsampling can only be set for JPEG outputs (output format '{output_format}')")
 
-    def get_buffer_size(image, quality=100):
-        buffer = io.BytesIO()
-        image.save(buffer, quality=quality, format='JPEG')
-        return len(buffer.getvalue()) / 1024, buffer
+def output_filename(filename, output_format='jpeg'):
+    """
+    Name of the output file for an input file. JPEG outputs keep the input name, other formats get their extension.
+    """
+    spec = OUTPUT_FORMATS[output_format]
+    if spec['format'] == 'JPEG':
+        return filename
+    return os.path.splitext(filename)[0] + spec['ext']
 
-    basename = os.path.basename(output_path)
-    quality = 100
-    size_kb, buffer = get_buffer_size(img, quality)
+def encode_image(image, quality=None, output_format='jpeg', subsampling=None):
+    """
+    Encode an image in one of the OUTPUT_FORMATS in memory and return the bytes.
+    If quality is None, the encoder's default quality is used.
+    :param subsampling: Chroma subsampling of JPEG outputs, one of SUBSAMPLING_MODES ('4:4:4' keeps sharper
+                        colours at a larger size); None keeps the default of the format
+    """
+    spec = OUTPUT_FORMATS[output_format]
+    options = dict(spec['options'], subsampling=subsampling) if subsampling else spec['options']
+    buffer = io.BytesIO()
+    if quality is None:
+        image.save(buffer, format=spec['format'], **options)
+    else:
+        image.save(buffer, quality=quality, format=spec['format'], **options)
+    return buffer.getvalue()
 
-    if size_kb < min_kb:
-        print(f"⚠️ {basename}: Too SMALL at {size_kb:.2f} KB (quality {quality}).")
-        return False
+def model_bpp(quality, model=QUALITY_BPP_MODEL):
+    """
+    Bits per pixel predicted by a quality model (default: JPEG) for a quality (linear interpolation).
+    """
+    for (q_hi, bpp_hi), (q_lo, bpp_lo) in zip(model, model[1:]):
+        if quality >= q_lo:
+            return bpp_lo + (bpp_hi - bpp_lo) * (quality - q_lo) / (q_hi - q_lo)
+    return model[-1][1]
 
-    elif size_kb > max_kb:
-        while size_kb > max_kb and quality > 4:
-            quality -= 5
-            size_kb, buffer = get_buffer_size(img, quality)
+def estimate_quality(target_bpp, model=QUALITY_BPP_MODEL):
+    """
+    Estimate the quality that encodes a photo at target_bpp bits per pixel, using a quality model (default: JPEG).
+    """
+    for (q_hi, bpp_hi), (q_lo, bpp_lo) in zip(model, model[1:]):
+        if target_bpp >= bpp_lo:
+            fraction = min(1.0, (target_bpp - bpp_lo) / (bpp_hi - bpp_lo))
+            return int(q_lo + (q_hi - q_lo) * fraction)
+    return model[-1][0]
+
+def search_quality(img, min_kb=50, max_kb=1024, min_quality=MIN_QUALITY, output_format='jpeg', subsampling=None):
+    """
+    Search the highest quality in [min_quality, 100] whose output in output_format is at most max_kb.
+    Each probe is placed by the quality model of the format, rescaled to how this photo actually compressed
+    in the previous probe, and kept inside the binary-search bracket. The search stops early
+    once the output is within ACCEPT_FRACTION of max_kb (and at least min_kb).
+    Returns a dict with 'data' (None if even min_quality is too big), 'quality', 'size_kb' and 'encodes'.
+    """
+    model = OUTPUT_FORMATS[output_format]['model']
+    lo, hi = min_quality, 100
+    accept_kb = max(min_kb, max_kb * ACCEPT_FRACTION)
+    pixels = max(1, img.size[0] * img.size[1])
+    target_bpp = (accept_kb + max_kb) / 2 * 1024 * 8 / pixels
+    quality = min(hi, max(lo, estimate_quality(target_bpp, model)))
+    best = {'data': None, 'quality': None, 'size_kb': None, 'encodes': 0}
+
+    while lo <= hi:
+        data = encode_image(img, quality, output_format, subsampling)
+        best['encodes'] += 1
+        size_kb = len(data) / 1024
         if size_kb > max_kb:
-            print(f"⚠️ {basename}: Too Big at quality {quality}.")
-            return False
+            hi = quality - 1
+            if best['data'] is None:
+                best.update(quality=quality, size_kb=size_kb)
+        else:
+            best.update(data=data, quality=quality, size_kb=size_kb)
+            if size_kb >= accept_kb:
+                break
+            lo = quality + 1
+        if lo > hi:
+            break
+
+        # How much bigger or smaller than the model this photo compresses
+        ratio = (size_kb * 1024 * 8 / pixels) / model_bpp(quality, model)
+        guess = estimate_quality(target_bpp / ratio, model)
+        quality = guess if lo <= guess <= hi else (lo + hi) // 2
+
+    return best
+
+def fit_to_size(img, min_kb=50, max_kb=1024, min_quality=MIN_QUALITY, output_format='jpeg', subsampling=None):
+    """
+    Search for an encoding of the photo in output_format (see OUTPUT_FORMATS, and encode_image for subsampling)
+    within [min_kb, max_kb].
+    The quality is binary-searched; if even min_quality is too big, the photo is downscaled
+    (up to MAX_DOWNSCALES times) and searched again.
+    Returns a dict with 'data' (encoded bytes, None on failure), 'error' (message explaining the failure),
+    'quality', 'encodes' (number of encodes performed) and 'dimensions' of the encoded photo.
+    """
+    result = {'data': None, 'error': None, 'quality': None, 'encodes': 0, 'dimensions': img.size}
+    current = img
+    for _ in range(MAX_DOWNSCALES + 1):
+        found = search_quality(current, min_kb, max_kb, min_quality, output_format, subsampling)
+        result['encodes'] += found['encodes']
+        result['quality'] = found['quality']
+
+        if found['data'] is not None:
+            if found['size_kb'] < min_kb:
+                result['error'] = f"Too SMALL at {found['size_kb']:.2f} KB (quality {found['quality']})."
+            else:
+                result.update(data=found['data'], dimensions=current.size)
+            return result
+
+        # Too big even at min_quality: shrink the pixel count in proportion to the overshoot
+        scale = min(0.9, (max_kb * ACCEPT_FRACTION / found['size_kb']) ** 0.5)
+        width, height = current.size
+        current = img.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
 
-    with open(output_path, 'wb') as f:
-        f.write(buffer.getvalue())
+    result['error'] = f"Too Big at quality {min_quality} after {MAX_DOWNSCALES} downscales."
+    return result
+
+def adjust_photo_size(img, original_size_kb, min_kb=50, max_kb=1024, output_format='jpeg', subsampling=None):
+    """
+    Encode an RGB image for output in output_format. Photos whose original size is already within range are
+    saved with default settings as long as the result stays within range (it may not if the
+    photo was downscaled on load), all others go through fit_to_size.
+    Returns a dict like fit_to_size.
+    """
+    if min_kb <= original_size_kb <= max_kb:
+        data = encode_image(img, output_format=output_format, subsampling=subsampling)
+        if min_kb <= len(data) / 1024 <= max_kb:
+            return {'data': data, 'error': None, 'quality': None, 'encodes': 1, 'dimensions': img.size}
+        fit = fit_to_size(img, min_kb, max_kb, output_format=output_format, subsampling=subsampling)
+        fit['encodes'] += 1
+        return fit
+    return fit_to_size(img, min_kb, max_kb, output_format=output_format, subsampling=subsampling)
+
+def resize_photo(img, output_path, min_kb=50, max_kb=1024, output_format='jpeg', subsampling=None):
+    """
+    Adjust the size of a photo to fall within the specified size range, encoded in output_format.
+    Returns True if adjustment was successful, False otherwise.
+    """
+    basename = os.path.basename(output_path)
+    fit = fit_to_size(img, min_kb, max_kb, output_format=output_format, subsampling=subsampling)
+    if fit['data'] is None:
+        print(f"⚠️ {basename}: {fit['error']}")
+        return False
+
+    atomic_write_bytes(output_path, fit['data'])
     return True
 
+def resize_photo_data(data, min_kb=50, max_kb=1024, max_dimension=None, output_format='jpeg', subsampling=None):
+    """
+    Resize encoded photo bytes to fall within [min_kb, max_kb], encoded in output_format.
+    Returns a tuple (output, error, encodes): the resized bytes and None on success, or the photo
+    re-encoded at default quality (for the failed folder) and a message explaining the failure,
+    plus the number of encodes it took.
+    """
+    img = load_image(io.BytesIO(data), max_dimension)
+    if img.mode == 'RGBA':
+        img = img.convert('RGB')
+
+    fit = adjust_photo_size(img, len(data) / 1024, min_kb, max_kb, output_format, subsampling)
+    if fit['data'] is None:
+        output = encode_image(img, output_format=output_format, subsampling=subsampling)
+        return output, fit['error'], fit['encodes'] + 1
+    return fit['data'], None, fit['encodes']
 
-def resize_photos_in_folder(input_folder, output_folder, min_kb=50, max_kb=1024):
+def resize_photo_file(input_path, output_path, fail_path, min_kb=50, max_kb=1024, max_dimension=None, cache=None,
+                      output_format='jpeg', subsampling=None):
     """
-    Process all images in a folder and adjust their sizes to be within the target range.
+    Resize a single photo file. Photos that cannot be brought within range are saved to fail_path.
+    If max_dimension is given, the photo is decoded at reduced resolution (see load_image).
+    If a ProcessingCache is given, the result is served from / stored in it.
+    Returns a dictionary with 'ok', 'error' (message explaining the failure), 'cache_hit',
+    'bytes_in', 'bytes_out' and 'encodes'.
     """
-    os.makedirs(output_folder, exist_ok=True)
-    fail_subfolder = os.path.join(output_folder, "failed")
-    os.makedirs(fail_subfolder, exist_ok=True)
+    with open(input_path, 'rb') as f:
+        data = f.read()
 
-    for filename in os.listdir(input_folder):
-        if not filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-            continue  # skip non-image files
+    key = cache.make_key(data, 'resize', min_kb, max_kb, max_dimension, output_format, subsampling) if cache else None
+    entry = cache.get(key) if cache else None
+    encodes = 0
+    if entry is not None:
+        error, output = entry[0].get('error'), entry[1]
+    else:
+        output, error, encodes = resize_photo_data(data, min_kb, max_kb, max_dimension, output_format, subsampling)
+        if cache:
+            cache.put(key, output, {'error': error})
 
-        input_path = os.path.join(input_folder, filename)
-        output_path = os.path.join(output_folder, filename)
+    atomic_write_bytes(fail_path if error else output_path, output)
+    return {'ok': error is None, 'error': error, 'cache_hit': entry is not None,
+            'bytes_in': len(data), 'bytes_out': len(output), 'encodes': encodes}
 
-        try:
-            original_size_kb = os.path.getsize(input_path) / 1024
+def _resize_task(task):
+    """
+    Resize one file for resize_photos_in_folder. Returns the result of resize_photo_file
+    plus 'file' and 'seconds'.
+    """
+    input_path = task[0]
+    start = time.perf_counter()
+    try:
+        result = resize_photo_file(*task)
+    except Exception as e:
+        result = {'ok': False, 'error': f"Error during processing — {e}", 'cache_hit': False}
+    result['file'] = os.path.basename(input_path)
+    result['seconds'] = time.perf_counter() - start
+    return result
 
-            with Image.open(input_path) as img:
-                img = ImageOps.exif_transpose(img)
-                if img.mode == 'RGBA':
-                    img = img.convert('RGB')
+def resize_photos_in_folder(input_folder, output_folder, min_kb=50, max_kb=1024, workers=1, max_dimension=None,
+                            cache=None, metrics=None, progress=None, dedupe=False, run_manifest=None,
+                            output_format='jpeg', shard=None, max_memory=None, subsampling=None):
+    """
+    Process all images in a folder and adjust their sizes to be within the target range.
+    :param max_dimension: Longest side in pixels of the output photos (None keeps full resolution)
+    :param workers: Number of worker processes (None or 0 = one per CPU core)
+    :param cache: Optional ProcessingCache; unchanged photos are then copied from it instead of re-encoded
+    :param metrics: Optional RunMetrics recording per-file timings under the 'resize' stage
+    :param progress: Optional callback called as progress(done, total) after each photo
+    :param dedupe: Process byte-identical photos (see dedup.split_duplicates) only once and copy the output
+                   to the duplicates
+    :param run_manifest: Optional RunManifest; photos finished by a previous run are skipped and each photo's
+                     outcome is recorded under the 'resize' stage as soon as it is resized
+    :param output_format: Encoder of the output photos, one of OUTPUT_FORMATS: 'jpeg' (baseline, default),
+                          'progressive_jpeg', 'webp' or 'avif'. Non-JPEG outputs get the format's extension
+    :param subsampling: Chroma subsampling of JPEG outputs, one of SUBSAMPLING_MODES (default: the format's)
+    :param shard: Optional (index, count) tuple from sharding.parse_shard; only the photos of that shard are resized
+    :param max_memory: Optional memory budget in bytes; workers and photos in flight are limited to stay within
+                       it, by the estimated decoded size of each photo (see memory_budget)
+    :return: List of error records ({'file', 'stage', 'error'}) for photos that could not be resized
+    """
+    check_output_format(output_format, subsampling)
+    os.makedirs(output_folder, exist_ok=True)
+    fail_subfolder = os.path.join(output_folder, "failed")
+    os.makedirs(fail_subfolder, exist_ok=True)
 
-                if min_kb <= original_size_kb <= max_kb:
-                    img.save(output_path, format='JPEG')
-                else:
-                    success = resize_photo(img, output_path, min_kb, max_kb)
-                    if not success:
-                        fail_path = os.path.join(fail_subfolder, filename)
-                        img.save(fail_path, format='JPEG')
-        
+    def make_task(filename):
+        return (
+            os.path.join(input_folder, filename),
+            os.path.join(output_folder, output_filename(filename, output_format)),
+            os.path.join(fail_subfolder, output_filename(filename, output_format)),
+            min_kb,
+            max_kb,
+            max_dimension,
+            cache,
+            output_format,
+            subsampling,
+        )
 
-        except Exception as e:
-            print(f"💥 {filename}: Error during processing — {e}")
+    results, _ = map_photo_folder(
+        'resize', _resize_task, make_task, input_folder, SUPPORTED_EXTS, output_folder, fail_subfolder,
+        output_name=lambda filename: output_filename(filename, output_format), workers=workers,
+        max_dimension=max_dimension, cache=cache, metrics=metrics, progress=progress, dedupe=dedupe,
+        run_manifest=run_manifest, shard=shard, max_memory=max_memory,
+    )
+    errors = [{'file': result['file'], 'stage': 'resize', 'error': result['error']} for result in results if not result['ok']]
 
-    fail_num = len(os.listdir(fail_subfolder))
-    if fail_num > 0:
-        print(f"⚠️ {fail_num} photos failed to resize and were moved to '{fail_subfolder}'.")
+    if errors:
+        print(f"⚠️ {len(errors)} photos failed to resize. Photos outside the size range were moved to '{fail_subfolder}'.")
     else:
         print("✅ All photos resized successfully.")
+    return errors
@@ -1,6 +1,28 @@
+import csv
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-import pandas as pd
+from src.image_headers import read_image_header
+from src.metrics import measure_stage
+from src.sharding import in_shard
+from src.parallel import map_in_workers
+
+SUPPORTED_EXTS = ('.jpg', '.jpeg', '.png', '.webp', '.avif')
+FAST_VALIDATION_THREADS = 32
+FAST_VALIDATION_CHUNK = 256
+
+def build_validation_record(photoname, file_size_bytes, width, height):
+    """
+    Build the validation record for a photo from its name, encoded size and dimensions.
+    """
+    return {
+        'Photo_Name': photoname,
+        'file_size_kb': file_size_bytes / 1024,  # in KB
+        'width': width,
+        'height': height,
+        'ratio': width / height if height else None,
+    }
 
 def validate_photo(photo_path):
     """
@@ -10,18 +32,8 @@ def validate_photo(photo_path):
     try:
         with Image.open(photo_path) as img:
             photoname = os.path.splitext(os.path.basename(photo_path))[0]
-            file_size_kb = os.path.getsize(photo_path) / 1024  # in KB
-            width = img.size[0]
-            height = img.size[1]
-            ratio = width / height if height != 0 else None
-
-            result_dict = {
-                'Photo_Name': photoname,
-                'file_size_kb': file_size_kb,
-                'width': width,
-                'height': height,
-                'ratio': ratio,
-            }
+            width, height = img.size
+            result_dict = build_validation_record(photoname, os.path.getsize(photo_path), width, height)
         
         return result_dict
 
@@ -29,39 +41,151 @@ def validate_photo(photo_path):
         print(f"❌ Error while processing {photo_path}: {e}")
         return None
 
-def validate_photos_in_folder(folder_path):
+def validate_photo_header(photo_path, file_size=None):
+    """
+    Validate a single photo from its file header only, without decoding it.
+    Width and height are reported after EXIF rotation, and truncated or corrupt files are flagged
+    in the 'status' column instead of being skipped.
+    :param photo_path: Path of the photo
+    :param file_size: File size in bytes if already known (e.g. from os.scandir)
+    :return: Dictionary with the validation record plus 'status'
+    """
+    photoname = os.path.splitext(os.path.basename(photo_path))[0]
+    try:
+        if file_size is None:
+            file_size = os.path.getsize(photo_path)
+        header = read_image_header(photo_path)
+    except OSError as e:
+        header = {'width': None, 'height': None, 'status': 'corrupt', 'error': str(e)}
+        file_size = file_size or 0
+
+    result_dict = build_validation_record(photoname, file_size, header['width'], header['height'])
+    result_dict['status'] = header['status']
+    return result_dict
+
+def validate_photos_in_folder(folder_path, fast=False, workers=None, metrics=None, shard=None, quality=False,
+                              source_folder=None, quality_workers=1):
     """
     Validate all photos in a given folder.
     Returns a list of dictionaries with validation results for each photo.
+    :param folder_path: Folder containing the photos
+    :param fast: Read dimensions from the file headers only (see validate_photo_header) on a thread pool
+    :param workers: Number of threads used in fast mode (default: 32)
+    :param metrics: Optional RunMetrics recording per-file timings under the 'validate' stage
+    :param shard: Optional (index, count) tuple from sharding.parse_shard; only the photos of that shard are validated
+    :param quality: Add the quality columns of quality.quality_metrics (sharpness, exposure, quality_issue, ...),
+                    measured on downscaled copies of the photos, timed under the 'quality' stage
+    :param source_folder: Optional folder of the photos the validated ones were made from (e.g. the cropped photos
+                          for the resized ones), matched by photo name, to fill the ssim and psnr columns
+    :param quality_workers: Number of worker processes for the quality metrics (None or 0 = one per CPU core)
+    """
+    with measure_stage(metrics, 'validate'):
+        records = _validate_folder(folder_path, fast, workers, metrics, shard)
+    if quality:
+        with measure_stage(metrics, 'quality'):
+            _add_quality_columns(records, folder_path, source_folder, quality_workers, shard)
+    return records
+
+def _add_quality_columns(records, folder_path, source_folder, workers, shard=None):
+    """
+    Compute the quality metrics of the photos in folder_path and add them to their validation records.
     """
+    from src.quality import quality_task, print_quality_summary  # imported on first use: numpy is slow to load
+
+    sources = {}
+    if source_folder is not None and os.path.isdir(source_folder):
+        for filename in sorted(os.listdir(source_folder)):
+            if filename.lower().endswith(SUPPORTED_EXTS):
+                sources.setdefault(os.path.splitext(filename)[0], os.path.join(source_folder, filename))
+    filenames = sorted(filename for filename in os.listdir(folder_path) if _is_listed(filename, shard))
+    tasks = [
+        (os.path.join(folder_path, filename), sources.get(os.path.splitext(filename)[0]))
+        for filename in filenames
+    ]
+    columns = dict(map_in_workers(quality_task, tasks, workers))
+    for record in records:
+        record.update(columns.get(record['Photo_Name'], {}))
+    print_quality_summary(records)
+
+def _timed_validation(validate, metrics, photo_path, *args):
+    """
+    Run validate(photo_path, *args) and record its duration in metrics (if given).
+    """
+    start = time.perf_counter()
+    result_dict = validate(photo_path, *args)
+    if metrics:
+        ok = result_dict is not None and result_dict.get('status', 'ok') == 'ok'
+        metrics.record('validate', os.path.basename(photo_path), time.perf_counter() - start,
+                       bytes_in=result_dict['file_size_kb'] * 1024 if result_dict else 0, ok=ok)
+    return result_dict
+
+def _is_listed(filename, shard):
+    return filename.lower().endswith(SUPPORTED_EXTS) and in_shard(os.path.splitext(filename)[0], shard)
+
+def _validate_folder(folder_path, fast, workers, metrics, shard=None):
+    if fast:
+        with os.scandir(folder_path) as entries:
+            photos = sorted(
+                (entry.name, entry.path, entry.stat().st_size)
+                for entry in entries
+                if _is_listed(entry.name, shard) and entry.is_file()
+            )
+        # Hand out files in chunks: per-file futures would cost more than reading the headers
+        chunks = [photos[i:i + FAST_VALIDATION_CHUNK] for i in range(0, len(photos), FAST_VALIDATION_CHUNK)]
+        validate_chunk = lambda chunk: [
+            _timed_validation(validate_photo_header, metrics, path, size) for _, path, size in chunk
+        ]
+        with ThreadPoolExecutor(max_workers=workers or FAST_VALIDATION_THREADS) as executor:
+            return [result for results in executor.map(validate_chunk, chunks) for result in results]
+
     result_dict_list = []
     for filename in os.listdir(folder_path):
-        if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+        if _is_listed(filename, shard):
             photo_path = os.path.join(folder_path, filename)
-            result_dict = validate_photo(photo_path)
+            result_dict = _timed_validation(validate_photo, metrics, photo_path)
             if result_dict:
                 result_dict_list.append(result_dict)
     return result_dict_list
 
 def save_validation_results(results, output_path, merge_original_df=None, left_on='Photo_Name', right_on='Photo_Name'):
     """
-    Save validation results to an Excel file.
+    Save validation results to an Excel file, or to a CSV file if output_path ends with .csv.
     If merge_original_df is provided, merge it with the validation results on merge_on column.
+    CSV reports without merge are written without pandas, so validation-only runs start fast.
     :param results: List of dictionaries with validation results
-    :param output_path: Path to save the Excel file
+    :param output_path: Path to save the Excel or CSV file
     :param merge_original_df: DataFrame to merge with validation results (optional)
     :param left_on: Column name in merge_original_df to merge on
     :param right_on: Column name in results to merge on
     """
-    df = pd.DataFrame(results)
-    
     # Make sure output folder exists
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
+    is_csv = str(output_path).lower().endswith('.csv')
+
     try:
-        if merge_original_df is not None:
-            df = pd.merge(merge_original_df, df, how='left', left_on=left_on, right_on=right_on)
-        df.to_excel(output_path, index=False)
+        if is_csv and merge_original_df is None:
+            _write_csv(results, output_path)
+        else:
+            import pandas as pd  # imported on first use, only Excel reports and merges need it
+
+            df = pd.DataFrame(results)
+            if merge_original_df is not None:
+                df = pd.merge(merge_original_df, df, how='left', left_on=left_on, right_on=right_on)
+            if is_csv:
+                df.to_csv(output_path, index=False)
+            else:
+                df.to_excel(output_path, index=False)
         print(f"✅ Validation results saved to {output_path}")
     except Exception as e:
         print(f"❌ Failed to save validation results: {e}")
+
+def _write_csv(results, output_path):
+    """
+    Write validation records to a CSV file with the csv module, columns in order of first appearance
+    (like pandas.DataFrame(results).to_csv).
+    """
+    fieldnames = list(dict.fromkeys(key for result in results for key in result))
+    with open(output_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(results)
@@ -0,0 +1,252 @@
+import csv
+import os
+import queue
+import threading
+from datetime import datetime
+from src.parse_excel import load_report, extract_profile_data
+from src.downloader import download_photos
+from src.pipeline import process_photo_files
+from src.cropper import SUPPORTED_EXTS
+from src.face_detect import resolve_crop_mode
+from src.size_adjuster import check_output_format, output_filename
+from src.parallel import resolve_workers
+
+REPORT_EXTS = ('.xlsx', '.xlsm', '.csv', '.parquet', '.pq')
+ROLLING_REPORT_FIELDS = ['processed_at', 'file', 'ok', 'error', 'Photo_Name', 'file_size_kb', 'width', 'height', 'ratio']
+
+class FolderWatcher:
+    """
+    Polls a folder for new or changed files. A file is handed out once its size and modification time
+    did not change between two polls, so files that are still being copied in are not picked up half-written.
+    :param folder: Folder to watch
+    :param exts: Extensions of the files to watch
+    :param is_done: Optional function is_done(path) telling whether a file found by the first poll was
+                    already handled by a previous run; such files are skipped until they change
+    """
+    def __init__(self, folder, exts, is_done=None):
+        self.folder = str(folder)
+        self.exts = exts
+        self.is_done = is_done
+        self.handled = {}  # filename -> (size, mtime) when it was handed out
+        self.pending = {}  # filename -> (size, mtime) seen by the last poll
+        self.first_poll = True
+        self._lock = threading.Lock()
+
+    def _signature(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def poll(self):
+        """
+        Return the paths of the files that are new or changed since they were handed out, and stable.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        ready = []
+        with self._lock:
+            seen = {}
+            for filename in sorted(os.listdir(self.folder)):
+                if not filename.lower().endswith(self.exts):
+                    continue
+                path = os.path.join(self.folder, filename)
+                signature = self._signature(path)
+                if signature is None or self.handled.get(filename) == signature:
+                    continue
+                if self.first_poll and self.is_done is not None and self.is_done(path):
+                    self.handled[filename] = signature
+                elif self.pending.get(filename) == signature:
+                    self.handled[filename] = signature
+                    ready.append(path)
+                else:
+                    seen[filename] = signature
+            self.pending = seen
+            self.first_poll = False
+        return ready
+
+    def claim(self, path):
+        """
+        Mark a file as handed out by another stage (e.g. the downloader). Returns False if the file,
+        in its current state, was already handed out.
+        """
+        filename = os.path.basename(path)
+        signature = self._signature(path)
+        with self._lock:
+            if signature is None or self.handled.get(filename) == signature:
+                return False
+            self.handled[filename] = signature
+            self.pending.pop(filename, None)
+            return True
+
+def has_output(output_folder, output_format="jpeg"):
+    """
+    Return an is_done function for FolderWatcher: a photo is done if output_folder (or its failed
+    subfolder) holds an output that is newer than the photo.
+    """
+    def is_done(path):
+        filename = output_filename(os.path.basename(path), output_format)
+        for folder in (output_folder, os.path.join(output_folder, "failed")):
+            output_path = os.path.join(folder, filename)
+            if os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(path):
+                return True
+        return False
+    return is_done
+
+def append_rolling_report(results, report_path):
+    """
+    Append per-file result records (with their validation record, if any) to a CSV report,
+    writing the header when the report is new.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    is_new = not os.path.exists(report_path) or os.path.getsize(report_path) == 0
+    processed_at = datetime.now().isoformat(timespec='seconds')
+    with open(report_path, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=ROLLING_REPORT_FIELDS, extrasaction='ignore')
+        if is_new:
+            writer.writeheader()
+        for result in results:
+            row = {'processed_at': processed_at, 'file': result['file'], 'ok': result['ok'], 'error': result['error']}
+            row.update(result['validation'] or {})
+            writer.writerow(row)
+
+def _put(stage_queue, item, stop):
+    """
+    Put an item on a bounded queue, waiting while it is full (backpressure) unless stop is set.
+    Returns False if the item was dropped because of stop.
+    """
+    while not stop.is_set():
+        try:
+            stage_queue.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get_batch(stage_queue, batch_size, timeout):
+    """
+    Wait up to timeout for an item, then take whatever else is already queued, up to batch_size items.
+    """
+    try:
+        batch = [stage_queue.get(timeout=timeout)]
+    except queue.Empty:
+        return []
+    while len(batch) < batch_size:
+        try:
+            batch.append(stage_queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+def watch(input_folder, output_folder, report_path, report_folder=None, report_sheet="Sheet1", interval=2.0,
+          queue_size=64, batch_size=16, workers=1, max_dimension=None, cache=None, metrics=None, crop_mode="center",
+          download_workers=8, rate_limit=5.0, output_format="jpeg", max_memory=None, stop=None, subsampling=None):
+    """
+    Keep processing new photos until stopped (Ctrl+C or stop.set()).
+    New photos dropped into input_folder are cropped, resized and validated (see process_photo_files),
+    and their results are appended to a rolling CSV report. If report_folder is given, new reports
+    dropped into it are read and their photos are downloaded into input_folder, then processed the same way.
+    Stages run in their own threads, connected by queues of at most queue_size items: when processing
+    falls behind, downloads and folder scans wait instead of piling up work.
+    Photos that already have an up-to-date output in output_folder are not processed again on restart.
+    :param input_folder: Folder of photos to watch (and to download photos into)
+    :param output_folder: Folder to save processed photos; failures go to output_folder/failed
+    :param report_path: Rolling validation report (CSV)
+    :param report_folder: Optional drop folder of Excel, CSV or Parquet reports with photo URLs
+    :param report_sheet: Name of the sheet to read from Excel reports
+    :param interval: Seconds between two scans of the watched folders
+    :param queue_size: Maximum number of items waiting between two stages
+    :param batch_size: Maximum number of photos processed (or downloaded) at once
+    :param workers: Number of worker processes for processing (None or 0 = one per CPU core). They are started
+                    once, before the scan and download threads, and reused for every batch
+    :param output_format: Encoder of the output photos, one of size_adjuster.OUTPUT_FORMATS
+    :param subsampling: Chroma subsampling of JPEG outputs, one of size_adjuster.SUBSAMPLING_MODES (default: the format's)
+    :param max_memory: Optional memory budget in bytes for processing (see process_photo_files)
+    :param stop: Optional threading.Event to stop watching (e.g. from another thread)
+    :return: Number of photos processed
+    """
+    stop = stop or threading.Event()
+    crop_mode = resolve_crop_mode(crop_mode)
+    check_output_format(output_format, subsampling)
+    os.makedirs(output_folder, exist_ok=True)
+    photo_watcher = FolderWatcher(input_folder, SUPPORTED_EXTS, is_done=has_output(output_folder, output_format))
+    report_watcher = FolderWatcher(report_folder, REPORT_EXTS) if report_folder else None
+    photo_queue = queue.Queue(maxsize=queue_size)
+    profile_queue = queue.Queue(maxsize=queue_size)
+    executor = None
+    if resolve_workers(workers) > 1:
+        import multiprocessing  # imported on first use: multiprocessing is slow to load
+        from concurrent.futures import ProcessPoolExecutor
+
+        # Workers are started without fork: forking copies the locks held by the running threads
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        executor = ProcessPoolExecutor(max_workers=resolve_workers(workers), mp_context=context)
+
+    def scan():
+        while not stop.is_set():
+            if report_watcher:
+                for path in report_watcher.poll():
+                    df = load_report(path, sheet_name=report_sheet)
+                    if df is None:
+                        continue
+                    profiles = extract_profile_data(df, id_col="Confirmation_Number", url_col="Image_URL",
+                                                    photoname_col="Photo_Name")
+                    print(f"📄 New report {os.path.basename(path)}: {len(profiles)} photos to download.")
+                    for profile in profiles:
+                        if not _put(profile_queue, profile, stop):
+                            return
+            for path in photo_watcher.poll():
+                if not _put(photo_queue, path, stop):
+                    return
+            stop.wait(interval)
+
+    def download():
+        while not stop.is_set():
+            profiles = _get_batch(profile_queue, batch_size, timeout=0.5)
+            if not profiles:
+                continue
+            try:
+                errors = download_photos(profiles, output_folder=input_folder, workers=download_workers,
+                                         rate_limit=rate_limit, metrics=metrics)
+            except Exception as e:
+                print(f"❌ Failed to download {len(profiles)} photos: {e}")
+                continue
+            failed = {str(profile["photoname"]) for profile in errors}
+            for profile in profiles:
+                path = os.path.join(str(input_folder), f"{profile['photoname']}.jpg")
+                if str(profile["photoname"]) not in failed and photo_watcher.claim(path):
+                    if not _put(photo_queue, path, stop):
+                        return
+
+    threads = [threading.Thread(target=scan, name='watch-scan', daemon=True)]
+    if report_watcher:
+        threads.append(threading.Thread(target=download, name='watch-download', daemon=True))
+    for thread in threads:
+        thread.start()
+
+    print(f"👀 Watching {input_folder}" + (f" and {report_folder}" if report_folder else "") + " (Ctrl+C to stop)...")
+    processed = 0
+    try:
+        while not stop.is_set():
+            paths = _get_batch(photo_queue, batch_size, timeout=0.5)
+            if not paths:
+                continue
+            results = process_photo_files(paths, output_folder, workers=workers, max_dimension=max_dimension,
+                                          cache=cache, metrics=metrics, crop_mode=crop_mode,
+                                          output_format=output_format, max_memory=max_memory,
+                                          subsampling=subsampling, executor=executor)
+            append_rolling_report(results, report_path)
+            processed += len(results)
+            failed = sum(1 for result in results if not result['ok'])
+            print(f"✅ {len(results)} new photos processed ({failed} failed), {processed} in total, "
+                  f"{photo_queue.qsize()} waiting.")
+    except KeyboardInterrupt:
+        print("🛑 Stopping...")
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        if executor is not None:
+            executor.shutdown()
+    return processed
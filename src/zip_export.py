@@ -0,0 +1,80 @@
+import io
+import os
+import zipfile
+
+# Formats that are already compressed: deflating them again costs CPU and saves nothing
+STORED_EXTS = ('.jpg', '.jpeg', '.png', '.webp', '.avif')
+CHUNK_SIZE = 64 * 1024
+
+class _ChunkBuffer(io.RawIOBase):
+    """
+    Write-only, unseekable sink for zipfile: collects the bytes written so far so they can be
+    handed out in chunks. zipfile then writes data descriptors instead of seeking back.
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def iter_zip(files):
+    """
+    Build a ZIP archive on the fly and yield it chunk by chunk, without writing it to disk.
+    Each file is read in CHUNK_SIZE blocks when it is reached, so the first bytes are available
+    as soon as the first file has been read, whatever the number of files.
+    JPEG/PNG/WebP/AVIF files are stored as is, other files (e.g. reports) are deflated.
+    :param files: Iterable of (path, arcname) tuples, consumed lazily
+    :return: Generator of bytes chunks
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w') as zipf:
+        for path, arcname in files:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            stored = os.path.splitext(path)[1].lower() in STORED_EXTS
+            info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+            with open(path, 'rb') as src, zipf.open(info, 'w') as dest:
+                while True:
+                    block = src.read(CHUNK_SIZE)
+                    if not block:
+                        break
+                    dest.write(block)
+                    if buffer.chunks:
+                        yield buffer.drain()
+            if buffer.chunks:
+                yield buffer.drain()  # data descriptor
+    yield buffer.drain()  # central directory
+
+def zip_bytes(files):
+    """
+    Build a ZIP archive in memory from (path, arcname) tuples (see iter_zip).
+    """
+    return b''.join(iter_zip(files))
+
+def run_output_files(root_folder, folders, filenames):
+    """
+    List the outputs of the current run, so files left over from earlier runs are not exported.
+    :param root_folder: Folder the archive names are relative to
+    :param folders: Output folders of the run; their 'failed' subfolders are included too
+    :param filenames: Names of the photos processed in this run
+    :return: List of (path, arcname) tuples for iter_zip
+    """
+    files = []
+    filenames = set(filenames)
+    for folder in folders:
+        for subfolder in (folder, os.path.join(folder, 'failed')):
+            if not os.path.isdir(subfolder):
+                continue
+            for filename in sorted(os.listdir(subfolder)):
+                path = os.path.join(subfolder, filename)
+                if filename in filenames and os.path.isfile(path):
+                    files.append((path, os.path.relpath(path, root_folder)))
+    return files
@@ -0,0 +1,24 @@
+import os
+from src.size_adjuster import resize_photos_in_folder
+from src.pipeline import process_photos_in_folder
+
+def write_corrupt_duplicates(folder):
+    """
+    Two byte-identical files that are not images, like the same error page downloaded for two photos.
+    """
+    os.makedirs(folder)
+    for filename in ('a.jpg', 'b.jpg'):
+        with open(os.path.join(folder, filename), 'wb') as f:
+            f.write(b'<html>Service unavailable</html>')
+
+def test_resize_dedupe_with_corrupt_duplicates(tmp_path):
+    write_corrupt_duplicates(tmp_path / 'in')
+    errors = resize_photos_in_folder(str(tmp_path / 'in'), str(tmp_path / 'out'), dedupe=True)
+    assert [error['file'] for error in errors] == ['a.jpg', 'b.jpg']
+    assert os.listdir(tmp_path / 'out' / 'failed') == []
+
+def test_process_dedupe_with_corrupt_duplicates(tmp_path):
+    write_corrupt_duplicates(tmp_path / 'in')
+    validation, errors = process_photos_in_folder(str(tmp_path / 'in'), str(tmp_path / 'out'), dedupe=True)
+    assert validation == []
+    assert [error['file'] for error in errors] == ['a.jpg', 'b.jpg']